@@ -0,0 +1,327 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Compiled alert rule engine for incoming traffic
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Rules are plain dictionaries (as stored in alerts.json), for example:
+#     {"kind": "keyword", "pattern": "MAYDAY"}
+#     {"kind": "node", "node": "!a1b2c3d4", "name": "Base camp radio"}
+#     {"kind": "battery", "below": 20}                                    (optionally with "node")
+#     {"kind": "geofence", "lat": 32.93, "lon": -105.81, "radius": 500}  (metres)
+#     {"kind": "geofence", "polygon": [[32.9, -105.9], [33.0, -105.9], [33.0, -105.8]]}
+# Every rule may also have a "name" and a "cooldown" (seconds between repeated alerts for the same node).  Keywords
+# match whole words only ("KE7" does not fire on "KE7KUS"); give a keyword rule "word": false to match anywhere.
+#
+# All rules are compiled together: keywords into one Aho-Corasick automaton, node rules into a hash table, battery
+# rules into a sorted threshold list and geofences into a grid index, so the cost of evaluating a packet depends on the
+# packet and the number of matches, not on the number of rules.  Run this file directly for a benchmark.
+
+
+import bisect, json, math, queue, threading, time
+
+from collections import deque, namedtuple
+
+Alert = namedtuple("Alert", ["rule", "node", "detail", "time"])
+
+GRID_SIZE = 0.05            # Geofence index cell size in degrees (about 5 km of latitude)
+METRES_PER_DEGREE = 111320.0
+DEFAULT_COOLDOWN = {"keyword": 0, "node": 300, "battery": 0, "geofence": 0}
+
+
+def ruleName(rule):
+    """Return the display name of a rule."""
+    if rule.get("name"):
+        return rule["name"]
+    kind = rule["kind"]
+    if kind == "keyword":
+        return 'Keyword "%s"' % rule["pattern"]
+    if kind == "node":
+        return "Node " + rule["node"]
+    if kind == "battery":
+        return "Battery below %g%%" % rule["below"]
+    return "Geofence"
+
+
+def loadRules(path):
+    """Load a list of rules from a JSON file.  A missing file means no rules."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton matching many case-insensitive keywords in one pass over the text."""
+
+    def __init__(self, keywords):
+        """Class instantiation.  keywords is an iterable of (keyword, value, wholeWord) triples; matches report the
+        values.  A wholeWord keyword must not have a letter or digit immediately before or after it in the text."""
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for keyword, value, wholeWord in keywords:
+            folded = keyword.casefold()
+            state = 0
+            for char in folded:
+                nextState = self.goto[state].get(char)
+                if nextState is None:
+                    nextState = len(self.goto)
+                    self.goto[state][char] = nextState
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nextState
+            # Boundaries are only checked on the sides where the keyword itself starts or ends with a letter or digit,
+            # so e.g. "#sos" still matches "x#sos".
+            self.output[state].append((value, len(folded), wholeWord and folded[:1].isalnum(), wholeWord and folded[-1:].isalnum()))
+
+        # Breadth-first pass to set failure links, merging each state's output with that of its failure state.
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, nextState in self.goto[state].items():
+                pending.append(nextState)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nextState] = self.goto[fallback].get(char, 0)
+                self.output[nextState] = self.output[nextState] + self.output[self.fail[nextState]]
+
+    def search(self, text):
+        """Return the set of values whose keywords occur in text."""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        text = text.casefold()
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for value, length, checkStart, checkEnd in output[state]:
+                if checkStart and position >= length and text[position - length].isalnum():
+                    continue
+                if checkEnd and position + 1 < len(text) and text[position + 1].isalnum():
+                    continue
+                found.add(value)
+        return found
+
+
+class Geofence:
+    """A circular or polygonal area."""
+
+    def __init__(self, rule):
+        """Class instantiation from a geofence rule."""
+        if "polygon" in rule:
+            self.polygon = [tuple(point) for point in rule["polygon"]]
+            lats = [lat for lat, lon in self.polygon]
+            lons = [lon for lat, lon in self.polygon]
+            self.bounds = (min(lats), min(lons), max(lats), max(lons))
+        else:
+            self.polygon = None
+            self.lat, self.lon, self.radius = rule["lat"], rule["lon"], rule["radius"]
+            dLat = self.radius / METRES_PER_DEGREE
+            dLon = dLat / max(0.01, math.cos(math.radians(self.lat)))
+            self.bounds = (self.lat - dLat, self.lon - dLon, self.lat + dLat, self.lon + dLon)
+
+    def contains(self, lat, lon):
+        """Return True if the point lies inside the fence."""
+        south, west, north, east = self.bounds
+        if not (south <= lat <= north and west <= lon <= east):
+            return False
+        if self.polygon is None:
+            dy = (lat - self.lat) * METRES_PER_DEGREE
+            dx = (lon - self.lon) * METRES_PER_DEGREE * math.cos(math.radians(self.lat))
+            return dx * dx + dy * dy <= self.radius * self.radius
+        inside = False
+        j = len(self.polygon) - 1
+        for i, (latI, lonI) in enumerate(self.polygon):
+            latJ, lonJ = self.polygon[j]
+            if (latI > lat) != (latJ > lat) and lon < (lonJ - lonI) * (lat - latI) / (latJ - latI) + lonI:
+                inside = not inside
+            j = i
+        return inside
+
+
+class RuleSet:
+    """A compiled set of alert rules.  evaluate() must only be called from one thread, as it tracks per-node state."""
+
+    def __init__(self, rules):
+        """Class instantiation.  Compiles the rules into their matchers."""
+        self.rules = list(rules)
+        keywords = []
+        self.nodeRules = {}
+        self.batteryRules = []
+        self.fences = []
+        self.grid = {}
+        for index, rule in enumerate(self.rules):
+            kind = rule["kind"]
+            if kind == "keyword":
+                keywords.append((rule["pattern"], index, rule.get("word", True)))
+            elif kind == "node":
+                self.nodeRules.setdefault(rule["node"], []).append(index)
+            elif kind == "battery":
+                self.batteryRules.append((rule["below"], index))
+            elif kind == "geofence":
+                fence = Geofence(rule)
+                self.fences.append((fence, index))
+                south, west, north, east = fence.bounds
+                for row in range(math.floor(south / GRID_SIZE), math.floor(north / GRID_SIZE) + 1):
+                    for column in range(math.floor(west / GRID_SIZE), math.floor(east / GRID_SIZE) + 1):
+                        self.grid.setdefault((row, column), []).append(len(self.fences) - 1)
+            else:
+                raise ValueError("Unknown alert rule kind: %s" % kind)
+        self.keywords = KeywordAutomaton(keywords) if keywords else None
+        self.batteryRules.sort()
+        self.batteryThresholds = [below for below, index in self.batteryRules]
+
+        self.lastAlert = {}         # (rule index, node) -> time of the last alert, for cooldowns
+        self.inside = {}            # node -> set of fence indexes the node is currently inside
+        self.lastBattery = {}       # node -> last reported battery level
+
+    def _fire(self, alerts, index, node, detail, now):
+        """Append an alert unless the rule is cooling down for this node."""
+        rule = self.rules[index]
+        cooldown = rule.get("cooldown", DEFAULT_COOLDOWN[rule["kind"]])
+        last = self.lastAlert.get((index, node))
+        if last is not None and now - last < cooldown:
+            return
+        self.lastAlert[(index, node)] = now
+        alerts.append(Alert(rule, node, detail, now))
+
+    def evaluate(self, packet, now=None):
+        """Return the alerts raised by one received packet."""
+        now = time.time() if now is None else now
+        alerts = []
+        node = packet.get("fromId") or "!%08x" % packet.get("from", 0)
+        decoded = packet.get("decoded", {})
+
+        for index in self.nodeRules.get(node, ()):
+            self._fire(alerts, index, node, "Heard from " + node, now)
+
+        text = decoded.get("text")
+        if text and self.keywords is not None:
+            for index in sorted(self.keywords.search(text)):
+                self._fire(alerts, index, node, text, now)
+
+        level = decoded.get("telemetry", {}).get("deviceMetrics", {}).get("batteryLevel")
+        if level is not None and self.batteryRules:
+            previous = self.lastBattery.get(node, 101)
+            self.lastBattery[node] = level
+            # Only rules whose threshold was crossed by this report: level < below <= previous.
+            start = bisect.bisect_right(self.batteryThresholds, level)
+            end = bisect.bisect_right(self.batteryThresholds, previous)
+            for below, index in self.batteryRules[start:end]:
+                rule = self.rules[index]
+                if rule.get("node") in (None, node):
+                    self._fire(alerts, index, node, "Battery at %d%%" % level, now)
+
+        position = decoded.get("position", {})
+        lat, lon = position.get("latitude"), position.get("longitude")
+        if lat is not None and lon is not None and self.fences:
+            candidates = self.grid.get((math.floor(lat / GRID_SIZE), math.floor(lon / GRID_SIZE)), ())
+            previous = self.inside.get(node, set())
+            current = {fenceIndex for fenceIndex in candidates if self.fences[fenceIndex][0].contains(lat, lon)}
+            for fenceIndex in current - previous:
+                self._fire(alerts, self.fences[fenceIndex][1], node, "Entered at %.5f, %.5f" % (lat, lon), now)
+            if current or previous:
+                self.inside[node] = current
+        return alerts
+
+
+class AlertEngine:
+    """Evaluates packets against a RuleSet on a background thread and passes alerts to a callback.
+
+    submit() never blocks, so it is safe to call from the radio reader thread.  The callback runs on the engine thread.
+    """
+
+    def __init__(self, rules, callback, maxQueue=10000):
+        """Class instantiation.  Compiles the rules and starts the engine thread."""
+        self.ruleset = RuleSet(rules)
+        self.callback = callback
+        self.queue = queue.Queue(maxQueue)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="alerts", daemon=True)
+        self.thread.start()
+
+    def setRules(self, rules):
+        """Compile a new rule list and swap it in."""
+        self.ruleset = RuleSet(rules)
+
+    def submit(self, packet):
+        """Queue a packet for evaluation, dropping it if the engine has fallen far behind."""
+        try:
+            self.queue.put_nowait(packet)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Stop the engine thread once the queued packets have been evaluated."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        """Engine thread loop."""
+        while True:
+            packet = self.queue.get()
+            if packet is None:
+                return
+            try:
+                alerts = self.ruleset.evaluate(packet)
+            except Exception:
+                # A malformed packet must not stop alerting for everything that follows.
+                continue
+            for alert in alerts:
+                self.callback(alert)
+
+
+if __name__ == '__main__':
+    # Benchmark: thousands of rules against a stream of mixed traffic.
+    import random, re, string
+
+    random.seed(1)
+    words = ["".join(random.choice(string.ascii_lowercase) for i in range(random.randint(4, 9))) for i in range(4000)]
+    nodes = ["!%08x" % random.getrandbits(32) for i in range(2000)]
+    rules = [{"kind": "keyword", "pattern": word} for word in words[:3000]]
+    rules += [{"kind": "keyword", "pattern": "MAYDAY"}]
+    rules += [{"kind": "node", "node": node, "cooldown": 0} for node in nodes[:500]]
+    rules += [{"kind": "battery", "below": below} for below in range(5, 50, 5)]
+    rules += [{"kind": "geofence", "lat": 32.9 + random.uniform(-1, 1), "lon": -105.8 + random.uniform(-1, 1), "radius": random.uniform(100, 5000)} for i in range(1000)]
+
+    packets = []
+    for i in range(20000):
+        packet = {"fromId": random.choice(nodes), "decoded": {}}
+        kind = i % 4
+        if kind == 0:
+            packet["decoded"]["text"] = " ".join(random.choice(words) for j in range(random.randint(3, 25)))
+        elif kind == 1:
+            packet["decoded"]["position"] = {"latitude": 32.9 + random.uniform(-1, 1), "longitude": -105.8 + random.uniform(-1, 1)}
+        elif kind == 2:
+            packet["decoded"]["telemetry"] = {"deviceMetrics": {"batteryLevel": random.randint(0, 100)}}
+        else:
+            packet["decoded"]["text"] = "mayday mayday at the trailhead"
+        packets.append(packet)
+
+    start = time.perf_counter()
+    ruleset = RuleSet(rules)
+    compiled = time.perf_counter() - start
+    start = time.perf_counter()
+    count = sum(len(ruleset.evaluate(packet, now=0.0)) for packet in packets)
+    elapsed = time.perf_counter() - start
+    print("%d rules compiled in %.1f ms" % (len(rules), compiled * 1000))
+    print("%d packets evaluated in %.2f s: %.0f packets/s, %.1f us/packet, %d alerts"
+          % (len(packets), elapsed, len(packets) / elapsed, elapsed / len(packets) * 1e6, count))
+
+    # Naive comparison: one regex per keyword rule, scanned against every text packet.
+    patterns = [re.compile(r"\b%s\b" % re.escape(rule["pattern"]), re.IGNORECASE) for rule in rules if rule["kind"] == "keyword"]
+    texts = [packet["decoded"]["text"] for packet in packets[:1000] if "text" in packet["decoded"]]
+    start = time.perf_counter()
+    for text in texts:
+        [pattern for pattern in patterns if pattern.search(text)]
+    naive = (time.perf_counter() - start) / len(texts)
+    start = time.perf_counter()
+    for text in texts:
+        ruleset.keywords.search(text)
+    compiledTime = (time.perf_counter() - start) / len(texts)
+    print("keyword matching per text packet: %.1f us compiled vs %.1f us per-rule regex" % (compiledTime * 1e6, naive * 1e6))
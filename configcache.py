@@ -0,0 +1,201 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# On-disk cache of Meshtastic radio configuration sections
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json, os, re, threading, time
+
+# Configuration sections shown in the Radio Configuration dialog, in display order.  Each section is a (kind, name) pair
+# where kind is "config" (LocalConfig), "module" (LocalModuleConfig) or "channel" (channel index 0-7).
+CONFIG_SECTIONS = ["device", "position", "power", "network", "display", "lora", "bluetooth"]
+MODULE_SECTIONS = ["mqtt", "serial", "external_notification", "store_forward", "range_test", "telemetry",
+                   "canned_message", "audio", "remote_hardware", "neighbor_info", "ambient_lighting",
+                   "detection_sensor", "paxcounter"]
+SECTIONS = ([("config", name) for name in CONFIG_SECTIONS] +
+            [("module", name) for name in MODULE_SECTIONS] +
+            [("channel", str(index)) for index in range(8)])
+
+# Maps the AdminMessage fields that change a node's configuration to the section kind they touch.  Replies to reads
+# (get*Response) are deliberately absent - they are the answers to our own section reads, not changes.
+ADMIN_SECTION_KINDS = {
+    "setConfig": "config",
+    "setModuleConfig": "module",
+    "setChannel": "channel",
+}
+
+
+def sectionKey(kind, name):
+    """Return the string used to store a section in the cache file."""
+    return kind + "." + name
+
+
+def sectionTitle(kind, name):
+    """Return a human-readable title for a section."""
+    if kind == "channel":
+        return "Channel " + name
+    return name.replace("_", " ").title()
+
+
+class ConfigCache:
+    """Caches radio configuration sections on disk, keyed by device ID and firmware version.
+
+    Sections are read from the file once and kept in memory.  Invalidating a section only flags it as stale, so the
+    dialog can keep showing the last known values while a fresh copy is read from the radio in the background.
+    """
+
+    def __init__(self, directory):
+        """Class instantiation.  Cache files are written to the given directory."""
+        self.directory = directory
+        self.deviceId = None
+        self.firmware = None
+        self.sections = {}
+
+    def path(self):
+        """Return the cache file path for the current device, or None if no device is selected."""
+        if self.deviceId is None:
+            return None
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", "%s-%s" % (self.deviceId, self.firmware or "unknown"))
+        return os.path.join(self.directory, name + ".json")
+
+    def select(self, deviceId, firmware):
+        """Switch the cache to the given device and firmware version, loading any sections previously stored."""
+        if (deviceId, firmware) == (self.deviceId, self.firmware):
+            return
+        self.deviceId = deviceId
+        self.firmware = firmware
+        self.sections = {}
+        try:
+            with open(self.path(), encoding="utf-8") as f:
+                self.sections = json.load(f).get("sections", {})
+        except (OSError, ValueError):
+            # Missing or unreadable cache file - every section will be read from the radio when it is viewed.
+            pass
+
+    def get(self, kind, name):
+        """Return the cached values for a section, or None if the section has never been read."""
+        entry = self.sections.get(sectionKey(kind, name))
+        return None if entry is None else entry["values"]
+
+    def isStale(self, kind, name):
+        """Return True if a section is missing from the cache or has been invalidated."""
+        entry = self.sections.get(sectionKey(kind, name))
+        return entry is None or entry["stale"]
+
+    def put(self, kind, name, values):
+        """Store freshly read section values and write the cache file."""
+        self.sections[sectionKey(kind, name)] = {"values": values, "stale": False, "time": time.time()}
+        self.save()
+
+    def invalidate(self, kind=None, name=None):
+        """Flag one section, every section of a kind, or the whole cache as stale."""
+        changed = False
+        for key, entry in self.sections.items():
+            entryKind, entryName = key.split(".", 1)
+            if kind not in (None, entryKind) or name not in (None, entryName) or entry["stale"]:
+                continue
+            entry["stale"] = True
+            changed = True
+        if changed:
+            self.save()
+
+    def save(self):
+        """Write the cache file atomically so a crash never leaves a half-written cache behind."""
+        path = self.path()
+        if path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temp = path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"deviceId": self.deviceId, "firmware": self.firmware, "sections": self.sections}, f)
+        os.replace(temp, path)
+
+
+def deviceIdentity(interface):
+    """Return the (device ID, firmware version) pair used to key the cache for a connected interface."""
+    deviceId = "!%08x" % interface.myInfo.my_node_num
+    metadata = getattr(interface, "metadata", None)
+    firmware = getattr(metadata, "firmware_version", "") or getattr(interface.myInfo, "firmware_version", "")
+    return deviceId, firmware or "unknown"
+
+
+def readSection(interface, kind, name, timeout=10.0):
+    """Read one configuration section from the radio and return it as a plain dictionary.
+
+    The radio is always asked, rather than trusting the copy the meshtastic library keeps from the connection handshake,
+    so a section changed by another client is picked up; the library's copy is updated with the reply.  Blocks until the
+    reply arrives or the timeout expires, so this must only be called from a worker thread.
+    """
+    from google.protobuf.json_format import MessageToDict
+    from pubsub import pub
+    try:
+        from meshtastic.protobuf import admin_pb2
+    except ImportError:
+        from meshtastic import admin_pb2
+
+    node = interface.localNode
+    replies = []
+    received = threading.Event()
+
+    def onAdmin(packet, interface):
+        # Replies to requests without a response handler are only published on pubsub.
+        if interface is not node.iface:
+            return
+        admin = packet.get("decoded", {}).get("admin", {}).get("raw")
+        if admin is None:
+            return
+        if kind == "channel":
+            if admin.HasField("get_channel_response") and admin.get_channel_response.index == int(name):
+                replies.append(admin.get_channel_response)
+                received.set()
+            return
+        field = "get_config_response" if kind == "config" else "get_module_config_response"
+        if admin.HasField(field) and getattr(admin, field).WhichOneof("payload_variant") == name:
+            replies.append(getattr(getattr(admin, field), name))
+            received.set()
+
+    pub.subscribe(onAdmin, "meshtastic.receive.admin")
+    try:
+        if kind == "channel":
+            # Node._requestChannel() goes on to request every later channel and rebuilds node.channels, so the single
+            # channel request is sent directly.
+            request = admin_pb2.AdminMessage()
+            request.get_channel_request = int(name) + 1
+            node._sendAdmin(request, wantResponse=True)
+        else:
+            config = node.localConfig if kind == "config" else node.moduleConfig
+            node.requestConfig(config.DESCRIPTOR.fields_by_name[name])
+        if not received.wait(timeout):
+            what = "channel " + name if kind == "channel" else "the %s configuration" % name
+            raise TimeoutError("Timed out reading %s from the radio." % what)
+    finally:
+        pub.unsubscribe(onAdmin, "meshtastic.receive.admin")
+
+    section = replies[0]
+    if kind == "channel":
+        channel = node.getChannelByChannelIndex(int(name))
+        if channel is not None:
+            channel.CopyFrom(section)
+    else:
+        getattr(node.localConfig if kind == "config" else node.moduleConfig, name).CopyFrom(section)
+    return MessageToDict(section, preserving_proto_field_name=True)
+
+
+def changedSections(admin):
+    """Return the (kind, name) sections touched by a decoded AdminMessage dictionary."""
+    changed = []
+    for field, kind in ADMIN_SECTION_KINDS.items():
+        payload = admin.get(field)
+        if not isinstance(payload, dict):
+            continue
+        if kind == "channel":
+            changed.append((kind, str(payload.get("index", 0))))
+        else:
+            changed.extend((kind, _snakeCase(name)) for name in payload)
+    return changed
+
+
+def _snakeCase(name):
+    """Convert a camelCase protobuf JSON field name back to its proto field name."""
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
@@ -0,0 +1,177 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Parallel device discovery and reconnect backoff
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Devices are identified by target strings: "serial:<port>" or "tcp:<host>[:<port>]".  Discovery does not run the full
+# meshtastic handshake on every candidate.  Instead each candidate gets a short probe - send a config request and wait
+# for the first framed reply - and all candidates are probed at once.  Only the winner is opened with the meshtastic
+# library.
+
+
+import random, socket, sys, time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+TCP_PORT = 4403
+START1 = 0x94
+START2 = 0xC3
+WAKE = bytes([START2]) * 32         # Wakes a sleeping device before the first frame, as the meshtastic library does
+PROBE_TIMEOUT = 2.0
+
+
+def serialTarget(port):
+    """Return the target string for a serial port."""
+    return "serial:" + port
+
+
+def tcpTarget(host):
+    """Return the target string for a TCP host ("host" or "host:port")."""
+    return "tcp:" + host
+
+
+def parseTarget(target):
+    """Split a target string into (kind, address, port).  port is None for serial targets."""
+    kind, address = target.split(":", 1)
+    if kind == "tcp":
+        host, _, port = address.partition(":")
+        return kind, host, int(port) if port else TCP_PORT
+    return kind, address, None
+
+
+def candidateTargets(tcpHosts=()):
+    """Return the serial ports that look like Meshtastic devices, followed by the configured TCP hosts.
+
+    If no port has a known Meshtastic USB ID, every USB serial port is returned instead; other serial ports are left alone."""
+    ports = []
+    try:
+        import meshtastic.util
+        ports = meshtastic.util.findPorts()
+    except Exception:
+        pass
+    if not ports:
+        # No port matched a known Meshtastic USB vendor ID - fall back to probing USB serial adapters.  Ports without a
+        # USB vendor ID (built-in UARTs, Bluetooth serial, modems) are never written to, as the probe could upset them.
+        try:
+            import serial.tools.list_ports
+            ports = [port.device for port in serial.tools.list_ports.comports() if port.vid is not None]
+        except ImportError:
+            ports = []
+    return [serialTarget(port) for port in ports] + [tcpTarget(host) for host in tcpHosts]
+
+
+def _probeFrame():
+    """Return a framed ToRadio want_config request."""
+    try:
+        from meshtastic.protobuf import mesh_pb2
+    except ImportError:
+        from meshtastic import mesh_pb2
+    request = mesh_pb2.ToRadio()
+    request.want_config_id = random.randint(1, 0xFFFFFFFF)
+    payload = request.SerializeToString()
+    return bytes([START1, START2, len(payload) >> 8, len(payload) & 0xFF]) + payload
+
+
+def _awaitFrame(read, timeout):
+    """Read until the start of a framed FromRadio packet is seen or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    buffer = b""
+    while time.monotonic() < deadline:
+        buffer = buffer[-1:] + read()
+        if bytes([START1, START2]) in buffer:
+            return True
+    return False
+
+
+def _clearHangup(path):
+    """Clear HUPCL on a serial port, as the meshtastic library does before opening one.  Otherwise closing the port
+    drops DTR/RTS, which resets ESP32-based radios - and the probe would reboot the device it is about to connect to."""
+    if sys.platform == "win32":
+        return
+    import termios
+    with open(path, encoding="utf8") as f:
+        attrs = termios.tcgetattr(f)
+        attrs[2] = attrs[2] & ~termios.HUPCL
+        termios.tcsetattr(f, termios.TCSAFLUSH, attrs)
+
+
+def probe(target, timeout=PROBE_TIMEOUT):
+    """Return True if a Meshtastic device answers on the target within the timeout.  Never raises."""
+    kind, address, port = parseTarget(target)
+    try:
+        if kind == "serial":
+            import serial
+            _clearHangup(address)
+            with serial.Serial(address, 115200, timeout=0.1, write_timeout=timeout, exclusive=True) as stream:
+                stream.write(WAKE + _probeFrame())
+                return _awaitFrame(lambda: stream.read(64), timeout)
+
+        with socket.create_connection((address, port), timeout=timeout) as sock:
+            sock.settimeout(0.1)
+            sock.sendall(_probeFrame())
+
+            def read():
+                try:
+                    return sock.recv(64)
+                except socket.timeout:
+                    return b""
+
+            return _awaitFrame(read, timeout)
+    except Exception:
+        return False
+
+
+def discover(targets, lastGood=None, timeout=PROBE_TIMEOUT):
+    """Return the target with a responding device, or None.
+
+    Every candidate is probed concurrently.  The last good target wins whenever it answers within the timeout, so with
+    several radios attached the same one is picked every session; otherwise the first other target to answer wins.
+    """
+    candidates = [target for target in targets if target != lastGood]
+    if lastGood is not None:
+        # Submitted first so it gets a worker straight away even when there are more candidates than workers.
+        candidates.insert(0, lastGood)
+    if not candidates:
+        return None
+    pool = ThreadPoolExecutor(max_workers=min(16, len(candidates)), thread_name_prefix="probe")
+    try:
+        pending = {pool.submit(probe, target, timeout): target for target in candidates}
+        winner = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                target = pending.pop(future)
+                if future.result():
+                    if target == lastGood:
+                        return target
+                    winner = winner or target
+            # Another device answered - only wait on for the last good one, which finishes within the timeout.
+            if winner is not None and lastGood not in pending.values():
+                return winner
+        return winner
+    finally:
+        # Don't wait for the slower probes - they finish on their own within the timeout.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def openInterface(target):
+    """Open a meshtastic interface on a target.  Blocks until the device has sent its configuration."""
+    kind, address, port = parseTarget(target)
+    if kind == "serial":
+        import meshtastic.serial_interface
+        return meshtastic.serial_interface.SerialInterface(devPath=address)
+    import meshtastic.tcp_interface
+    if port == TCP_PORT:
+        return meshtastic.tcp_interface.TCPInterface(hostname=address)
+    return meshtastic.tcp_interface.TCPInterface(hostname=address, portNumber=port)
+
+
+def backoffDelay(attempt, base=1.0, cap=60.0):
+    """Return the delay in seconds before reconnect attempt number attempt (0-based).
+
+    Exponential backoff with jitter, so several clients that lost the same device don't retry in lockstep.
+    """
+    # The exponent is clamped so a long outage can't overflow the float conversion (2 ** 1024).
+    limit = min(cap, base * 2 ** min(attempt, 32))
+    return random.uniform(limit / 2, limit)
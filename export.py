@@ -0,0 +1,203 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Streaming export of message history, node tracks and telemetry to CSV, GeoJSON and GPX
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Every export is a pipeline of generators: a database cursor yields rows, a formatter turns each row into a few lines of
+# text and a writer streams the text to a (optionally gzip or bz2 compressed) file.  Only one batch of rows is in memory
+# at a time, whatever the size of the history.
+
+
+import bz2, csv, datetime, gzip, io, itertools, json, sqlite3
+
+from xml.sax.saxutils import escape, quoteattr
+
+BATCH_SIZE = 500
+
+# (table, columns, ORDER BY) of each exportable history.  Tracks are ordered by node so each node's track is contiguous.
+QUERIES = {
+    "messages": ("messages", ["time", "sent", "channel", "sender", "peer", "text", "snr", "rssi"], "id"),
+    "tracks": ("positions", ["time", "node", "latitude", "longitude", "altitude", "snr", "rssi"], "node, time"),
+    "telemetry": ("telemetry", ["time", "node", "battery_level", "voltage", "channel_utilization", "air_util_tx",
+                                "temperature", "relative_humidity", "barometric_pressure"], "time"),
+}
+
+# Output formats available for each history.
+FORMATS = {
+    "messages": ["csv"],
+    "tracks": ["csv", "geojson", "gpx"],
+    "telemetry": ["csv"],
+}
+
+# Compressed output, chosen with a file name suffix (in any case) - suffix: opener.
+COMPRESSIONS = {
+    "gz": gzip.open,
+    "bz2": bz2.open,
+}
+
+
+class Cancelled(Exception):
+    """Raised when an export is cancelled by its progress callback."""
+
+
+def isoTime(timestamp):
+    """Format a UNIX timestamp as an ISO 8601 UTC time."""
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def countRows(dbPath, kind):
+    """Return the number of rows an export of the given history will write."""
+    db = sqlite3.connect(dbPath)
+    try:
+        return db.execute("SELECT COUNT(*) FROM " + QUERIES[kind][0]).fetchone()[0]
+    finally:
+        db.close()
+
+
+def iterRows(dbPath, kind):
+    """Yield the rows of a history as dictionaries, fetching BATCH_SIZE rows at a time.
+
+    Opens its own connection, so it can run on a worker thread while the GUI keeps writing to the database.
+    """
+    table, columns, order = QUERIES[kind]
+    db = sqlite3.connect(dbPath)
+    try:
+        cursor = db.execute("SELECT %s FROM %s ORDER BY %s" % (", ".join(columns), table, order))
+        while True:
+            batch = cursor.fetchmany(BATCH_SIZE)
+            if not batch:
+                break
+            for row in batch:
+                yield dict(zip(columns, row))
+    finally:
+        db.close()
+
+
+def toCsv(rows, columns):
+    """Yield CSV text for rows, starting with a header line.  Times are written in ISO 8601."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([isoTime(row[column]) if column == "time" else row[column] for column in columns])
+        yield buffer.getvalue()
+
+
+def _tracks(rows):
+    """Group consecutive position rows by node, yielding (node, point iterator) pairs without building a whole track."""
+    return itertools.groupby(rows, key=lambda row: row["node"])
+
+
+def nodesWithAltitude(dbPath):
+    """Return the set of nodes whose every stored position has an altitude."""
+    db = sqlite3.connect(dbPath)
+    try:
+        return {node for node, in db.execute("SELECT node FROM positions GROUP BY node HAVING COUNT(altitude) = COUNT(*)")}
+    finally:
+        db.close()
+
+
+def toGeoJson(rows, withAltitude=()):
+    """Yield a GeoJSON FeatureCollection with one feature per node track: a LineString, or a Point for a single fix.
+
+    Coordinates include the altitude only for nodes in withAltitude (see nodesWithAltitude()), so every feature has
+    one dimensionality without holding a whole track in memory.
+    """
+    yield '{"type": "FeatureCollection", "features": ['
+    first = True
+    for node, points in _tracks(rows):
+        # Geometry is written before the properties so the start/end times can be filled in after one pass over the track.
+        # The first coordinate is held back until the second shows whether the track is a LineString or a Point.
+        start = end = held = None
+        count = 0
+        for point in points:
+            coordinate = [point["longitude"], point["latitude"]]
+            if node in withAltitude and point["altitude"] is not None:
+                coordinate.append(point["altitude"])
+            if count == 0:
+                held = json.dumps(coordinate)
+            elif count == 1:
+                yield ("" if first else ",") + '\n{"type": "Feature", "geometry": {"type": "LineString", "coordinates": [' + held + ", " + json.dumps(coordinate)
+                first = False
+            else:
+                yield ", " + json.dumps(coordinate)
+            start = point["time"] if start is None else start
+            end = point["time"]
+            count += 1
+        if count == 1:
+            yield ("" if first else ",") + '\n{"type": "Feature", "geometry": {"type": "Point", "coordinates": ' + held + "}"
+            first = False
+        else:
+            yield "]}"
+        yield ', "properties": {"node": %s, "start": "%s", "end": "%s", "points": %d}}' % (json.dumps(node), isoTime(start), isoTime(end), count)
+    yield "\n]}\n"
+
+
+def toGpx(rows):
+    """Yield a GPX document with one track per node."""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<gpx version="1.1" creator="Meshtastic-Desktop" xmlns="http://www.topografix.com/GPX/1/1">\n'
+    for node, points in _tracks(rows):
+        yield "  <trk>\n    <name>%s</name>\n    <trkseg>\n" % escape(node)
+        for point in points:
+            yield "      <trkpt lat=%s lon=%s>" % (quoteattr(repr(point["latitude"])), quoteattr(repr(point["longitude"])))
+            if point["altitude"] is not None:
+                yield "<ele>%s</ele>" % point["altitude"]
+            yield "<time>%s</time></trkpt>\n" % isoTime(point["time"])
+        yield "    </trkseg>\n  </trk>\n"
+    yield "</gpx>\n"
+
+
+def splitCompression(path):
+    """Split a file name into its lower-cased name without any compression suffix and the compression (None if none)."""
+    name = path.lower()
+    stem, _, suffix = name.rpartition(".")
+    if stem and suffix in COMPRESSIONS:
+        return stem, suffix
+    return name, None
+
+
+def openOutput(path, compression=None):
+    """Open an output file for text, compressed with one of COMPRESSIONS if given."""
+    if compression is not None:
+        return COMPRESSIONS[compression](path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def export(dbPath, kind, fmt, path, progress=None, compression=None):
+    """Stream one history to a file, compressed with one of COMPRESSIONS if given.
+
+    progress, if given, is called as progress(rowsWritten, totalRows) every BATCH_SIZE rows; returning False cancels the
+    export, in which case Cancelled is raised and the partial file is left for the caller to remove.
+    """
+    if fmt not in FORMATS[kind]:
+        raise ValueError("%s cannot be exported as %s." % (kind, fmt))
+    total = countRows(dbPath, kind)
+    written = 0
+
+    def counted(rows):
+        nonlocal written
+        for row in rows:
+            yield row
+            written += 1
+            if progress is not None and written % BATCH_SIZE == 0 and progress(written, total) is False:
+                raise Cancelled()
+
+    rows = counted(iterRows(dbPath, kind))
+    if fmt == "csv":
+        chunks = toCsv(rows, QUERIES[kind][1])
+    elif fmt == "geojson":
+        chunks = toGeoJson(rows, nodesWithAltitude(dbPath))
+    else:
+        chunks = toGpx(rows)
+
+    with openOutput(path, compression) as f:
+        for chunk in chunks:
+            f.write(chunk)
+    if progress is not None:
+        progress(written, total)
+    return written
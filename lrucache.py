@@ -0,0 +1,48 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Bounded least-recently-used cache
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Dictionary-like cache holding at most maxSize entries.  The least recently used entry is evicted first."""
+
+    def __init__(self, maxSize):
+        """Class instantiation."""
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it as recently used, or return default if it is not cached."""
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            return default
+        return self.entries[key]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry if the cache is full."""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove and return the value for key."""
+        return self.entries.pop(key, default)
+
+    def clear(self):
+        """Remove every entry."""
+        self.entries.clear()
+
+    def __contains__(self, key):
+        """Return True if key is cached, without marking it as recently used."""
+        return key in self.entries
+
+    def __len__(self):
+        """Return the number of cached entries."""
+        return len(self.entries)
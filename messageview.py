@@ -0,0 +1,378 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Item view for long lists of variable-height rows (the Messages tab)
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# QListView lays out every row (asking the delegate for each row's size) whenever a size hint changes or the view is
+# resized, which is far too slow for a message history of 100,000 rows.  MessageView instead gives every row the same
+# estimated height until the row is first shown, then asks the delegate for that one row's size and corrects just that
+# row's entry in a table of row heights.  Row offsets come from a Fenwick tree over the corrections, so measuring a row,
+# finding a row's position and finding the row at a position all take O(log n) time.  A resize only clears the table.
+
+
+from PySide6.QtCore import Qt, QItemSelection, QModelIndex, QRect
+from PySide6.QtGui import QPainter, QRegion
+from PySide6.QtWidgets import QAbstractItemView, QStyle, QStyleOptionViewItem
+
+
+class RowHeights:
+    """Heights and offsets of rows that have an estimated height until they are measured."""
+
+    def __init__(self, estimate, count=0):
+        """Class instantiation."""
+        self.estimate = estimate
+        self.reset(count)
+
+    def reset(self, count):
+        """Forget every measurement and size the table for count rows."""
+        self.count = count
+        self.heights = [0] * count          # Measured height of each row, 0 if not measured yet
+        self.tree = [0] * (count + 1)       # Fenwick tree of (measured height - estimate)
+
+    def append(self, count=1):
+        """Add unmeasured rows at the end."""
+        for _ in range(count):
+            self.heights.append(0)
+            self.count += 1
+            i = self.count
+            # tree[i] covers rows (i - lowbit(i), i]; all but the new row are already in the tree.
+            self.tree.append(self._prefix(i - 1) - self._prefix(i - (i & -i)))
+
+    def _prefix(self, row):
+        """Return the sum of the corrections of the rows before row."""
+        total = 0
+        while row > 0:
+            total += self.tree[row]
+            row -= row & -row
+        return total
+
+    def isMeasured(self, row):
+        """Return True if the row has been measured."""
+        return self.heights[row] != 0
+
+    def height(self, row):
+        """Return the measured or estimated height of a row."""
+        return self.heights[row] or self.estimate
+
+    def setHeight(self, row, height):
+        """Record the measured height of a row.  Returns the change in the row's height."""
+        delta = height - self.height(row)
+        self.heights[row] = height
+        i = row + 1
+        while delta and i <= self.count:
+            self.tree[i] += delta
+            i += i & -i
+        return delta
+
+    def forget(self, row):
+        """Return a measured row to the estimated height."""
+        self.setHeight(row, self.estimate)
+        self.heights[row] = 0
+
+    def offset(self, row):
+        """Return the position of the top of a row (or the total height for row == count)."""
+        return row * self.estimate + self._prefix(row)
+
+    def rowAt(self, y):
+        """Return the row at position y, clamped to the existing rows.  Returns -1 if there are none."""
+        if self.count == 0:
+            return -1
+        row = 0
+        top = 0
+        step = 1 << (self.count.bit_length() - 1)
+        while step:
+            # Rows row + 1 .. row + step, which tree[row + step] covers because row is a multiple of 2 * step.
+            span = self.tree[row + step] + step * self.estimate if row + step <= self.count else None
+            if span is not None and top + span <= y:
+                row += step
+                top += span
+            step >>= 1
+        return min(row, self.count - 1)
+
+
+class MessageView(QAbstractItemView):
+    """Vertical list view of variable-height rows that only asks its delegate for the size of rows it shows.
+
+    Each row is measured once, when it first comes into view.  When rows above the first row already on screen turn out
+    taller or shorter than estimated, the view scrolls by the difference so the content on screen stays put.  A view
+    scrolled to the bottom stays at the bottom.
+    """
+
+    def __init__(self, parent=None, estimate=40):
+        """Class instantiation.  Inherits attributes from QAbstractItemView."""
+        super().__init__(parent)
+        self.rows = RowHeights(estimate)
+        self.measuring = False
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.verticalScrollBar().setSingleStep(20)
+
+    def setEstimatedRowHeight(self, estimate):
+        """Set the height assumed for rows that have not been shown yet."""
+        self.rows.estimate = estimate
+        self._remeasure()
+
+    def setItemDelegate(self, delegate):
+        """Set the delegate.  Rows measured by the previous delegate are measured again."""
+        super().setItemDelegate(delegate)
+        self._remeasure()
+
+    #---ROW HEIGHTS---#
+
+    def _sync(self):
+        """Bring the row table in line with the model.  Rows are normally only appended; anything else starts over."""
+        count = self.model().rowCount() if self.model() is not None else 0
+        if count > self.rows.count:
+            self.rows.append(count - self.rows.count)
+        elif count < self.rows.count:
+            self.rows.reset(count)
+
+    def _remeasure(self):
+        """Forget every row's height (e.g. after a width or font change), keeping the top row on screen in place."""
+        bar = self.verticalScrollBar()
+        top = self.rows.rowAt(bar.value())
+        inside = bar.value() - self.rows.offset(top) if top >= 0 else 0
+        atBottom = bar.value() >= bar.maximum()
+        self.rows.reset(self.rows.count)
+        self._sync()
+        self._updateScrollRange()
+        if atBottom:
+            bar.setValue(bar.maximum())
+        elif top >= 0:
+            bar.setValue(self.rows.offset(top) + min(inside, self.rows.height(top) - 1))
+        self._measureVisible()
+        self.viewport().update()
+
+    def _option(self):
+        """Return the style option rows are measured and painted with."""
+        option = QStyleOptionViewItem()
+        self.initViewItemOption(option)
+        return option
+
+    def _measure(self, row, option):
+        """Ask the delegate for one row's height and record it.  Returns the change in height."""
+        option.rect = QRect(0, 0, self.viewport().width(), self.rows.height(row))
+        height = self.itemDelegate().sizeHint(option, self.model().index(row, 0)).height()
+        return self.rows.setHeight(row, max(1, height))
+
+    def _measureVisible(self):
+        """Measure the rows on screen that still have the estimated height, keeping the content on screen from jumping."""
+        if self.measuring or self.model() is None:
+            return
+        self.measuring = True
+        try:
+            self._sync()
+            bar = self.verticalScrollBar()
+            option = self._option()
+            while True:
+                atBottom = 0 < bar.maximum() <= bar.value()
+                top = bar.value()
+                bottom = top + self.viewport().height()
+                first = self.rows.rowAt(top)
+                # The first row on screen that was measured before stays where it is; rows measured above it push it
+                # down, so the view scrolls along by the same amount (except at the very top).
+                anchor = first
+                while 0 <= anchor < self.rows.count and self.rows.offset(anchor) < bottom and not self.rows.isMeasured(anchor):
+                    anchor += 1
+                anchored = 0 <= anchor < self.rows.count and self.rows.isMeasured(anchor) and top > 0
+                shift = 0
+                measured = False
+                row = first
+                while 0 <= row < self.rows.count and self.rows.offset(row) < bottom + shift:
+                    if not self.rows.isMeasured(row):
+                        delta = self._measure(row, option)
+                        measured = True
+                        if anchored and row < anchor:
+                            shift += delta
+                    row += 1
+                self._updateScrollRange()
+                if atBottom:
+                    bar.setValue(bar.maximum())
+                elif shift:
+                    bar.setValue(top + shift)
+                # Scrolling may have brought more unmeasured rows into view.
+                if not measured:
+                    break
+        finally:
+            self.measuring = False
+
+    def _updateScrollRange(self):
+        """Match the scroll bar to the total height of the rows."""
+        bar = self.verticalScrollBar()
+        bar.setPageStep(self.viewport().height())
+        bar.setRange(0, max(0, self.rows.offset(self.rows.count) - self.viewport().height()))
+
+    #---QAbstractItemView---#
+
+    def reset(self):
+        """The model was reset - start with no measurements."""
+        super().reset()
+        self.rows.reset(self.model().rowCount() if self.model() is not None else 0)
+        self._updateScrollRange()
+        self._measureVisible()
+
+    def rowsInserted(self, parent, start, end):
+        """Rows were added to the model."""
+        super().rowsInserted(parent, start, end)
+        if start != self.rows.count:
+            self.rows.reset(self.model().rowCount())
+        self._sync()
+        self._updateScrollRange()
+        self._measureVisible()
+        self.viewport().update()
+
+    def rowsAboutToBeRemoved(self, parent, start, end):
+        """Rows are about to be removed - the row table is rebuilt once they are gone."""
+        super().rowsAboutToBeRemoved(parent, start, end)
+        self.rows.reset(self.rows.count - (end - start + 1))
+        self.viewport().update()
+
+    def dataChanged(self, topLeft, bottomRight, roles=()):
+        """Rows changed - measure them again when they are next shown."""
+        super().dataChanged(topLeft, bottomRight, roles)
+        for row in range(topLeft.row(), bottomRight.row() + 1):
+            if 0 <= row < self.rows.count and self.rows.isMeasured(row):
+                self.rows.forget(row)
+        self._measureVisible()
+        self.viewport().update()
+
+    def updateGeometries(self):
+        """Update the scroll bar after a resize or model change."""
+        self._sync()
+        self._updateScrollRange()
+        self._measureVisible()
+        super().updateGeometries()
+
+    def scrollContentsBy(self, dx, dy):
+        """Measure the rows scrolled into view and repaint."""
+        self._measureVisible()
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        """Row heights depend on the width, so a width change forgets them; a height change just shows more rows."""
+        super().resizeEvent(event)
+        if event.size().width() != event.oldSize().width():
+            self._remeasure()
+        else:
+            self._updateScrollRange()
+            self._measureVisible()
+
+    def changeEvent(self, event):
+        """A font change invalidates every row height."""
+        super().changeEvent(event)
+        if event.type() == event.Type.FontChange:
+            self._remeasure()
+
+    def scrollToBottom(self):
+        """Scroll to the last row.  Measuring the rows that come into view keeps the view at the bottom."""
+        self._sync()
+        self._updateScrollRange()
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+        self._measureVisible()
+
+    def paintEvent(self, event):
+        """Paint the rows on screen."""
+        if self.model() is None:
+            return
+        painter = QPainter(self.viewport())
+        option = self._option()
+        top = self.verticalScrollBar().value()
+        width = self.viewport().width()
+        selection = self.selectionModel()
+        row = self.rows.rowAt(top)
+        while 0 <= row < self.rows.count:
+            y = self.rows.offset(row) - top
+            if y >= self.viewport().height():
+                break
+            index = self.model().index(row, 0)
+            option.rect = QRect(0, y, width, self.rows.height(row))
+            option.state = QStyle.State_Enabled | (QStyle.State_Selected if selection is not None and selection.isSelected(index) else QStyle.State_None)
+            self.itemDelegate().paint(painter, option, index)
+            row += 1
+
+    def visualRect(self, index):
+        """Return the rectangle a row occupies in viewport coordinates."""
+        if not index.isValid() or index.row() >= self.rows.count:
+            return QRect()
+        row = index.row()
+        return QRect(0, self.rows.offset(row) - self.verticalScrollBar().value(), self.viewport().width(), self.rows.height(row))
+
+    def indexAt(self, point):
+        """Return the row under a viewport position."""
+        y = point.y() + self.verticalScrollBar().value()
+        if self.model() is None or y < 0 or y >= self.rows.offset(self.rows.count):
+            return QModelIndex()
+        return self.model().index(self.rows.rowAt(y), 0)
+
+    def scrollTo(self, index, hint=QAbstractItemView.EnsureVisible):
+        """Scroll so a row is visible."""
+        if not index.isValid() or index.row() >= self.rows.count:
+            return
+        row = index.row()
+        if not self.rows.isMeasured(row):
+            self._measure(row, self._option())
+            self._updateScrollRange()
+        bar = self.verticalScrollBar()
+        top, height, page = self.rows.offset(row), self.rows.height(row), self.viewport().height()
+        if hint == QAbstractItemView.PositionAtTop:
+            bar.setValue(top)
+        elif hint == QAbstractItemView.PositionAtBottom:
+            bar.setValue(top + height - page)
+        elif hint == QAbstractItemView.PositionAtCenter:
+            bar.setValue(top + (height - page) // 2)
+        elif top < bar.value():
+            bar.setValue(top)
+        elif top + height > bar.value() + page:
+            bar.setValue(top + height - page)
+
+    def moveCursor(self, action, modifiers):
+        """Return the row keyboard navigation moves to."""
+        current = self.currentIndex()
+        if self.model() is None or self.rows.count == 0:
+            return QModelIndex()
+        row = current.row() if current.isValid() else 0
+        page = max(1, self.viewport().height() // max(1, self.rows.estimate))
+        if action == QAbstractItemView.MoveUp:
+            row -= 1
+        elif action == QAbstractItemView.MoveDown:
+            row += 1
+        elif action == QAbstractItemView.MovePageUp:
+            row -= page
+        elif action == QAbstractItemView.MovePageDown:
+            row += page
+        elif action == QAbstractItemView.MoveHome:
+            row = 0
+        elif action == QAbstractItemView.MoveEnd:
+            row = self.rows.count - 1
+        return self.model().index(max(0, min(self.rows.count - 1, row)), 0)
+
+    def horizontalOffset(self):
+        """The view never scrolls horizontally."""
+        return 0
+
+    def verticalOffset(self):
+        """Return the vertical scroll position."""
+        return self.verticalScrollBar().value()
+
+    def isIndexHidden(self, index):
+        """No rows are hidden."""
+        return False
+
+    def setSelection(self, rect, flags):
+        """Select the rows a rubber band or click rectangle touches."""
+        if self.model() is None or self.rows.count == 0:
+            return
+        top = self.verticalScrollBar().value()
+        first = self.rows.rowAt(rect.top() + top)
+        last = self.rows.rowAt(rect.bottom() + top)
+        self.selectionModel().select(QItemSelection(self.model().index(first, 0), self.model().index(last, 0)), flags)
+
+    def visualRegionForSelection(self, selection):
+        """Return the viewport region covered by the selected rows."""
+        region = QRegion()
+        top = self.verticalScrollBar().value()
+        for selected in selection:
+            y = self.rows.offset(selected.top()) - top
+            region += QRegion(QRect(0, y, self.viewport().width(), self.rows.offset(selected.bottom() + 1) - top - y))
+        return region
@@ -0,0 +1,215 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Batched MQTT uplink of received mesh traffic with an on-disk spool for offline periods
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Requires paho-mqtt (pip3 install paho-mqtt).  The bridge is optional; the rest of the program works without it.
+#
+# Topics (under the configured prefix):
+#     <prefix>/packets          JSON array of the packets received during one batch interval
+#     <prefix>/nodes/<node id>  latest node information, retained; several updates to one node within a batch are
+#                               coalesced into one publish
+
+
+import base64, json, os, sqlite3, threading
+
+from collections import deque
+
+
+def jsonSafe(value):
+    """Convert a meshtastic packet or node dictionary into something json.dumps accepts."""
+    if isinstance(value, dict):
+        # "raw" holds the protobuf object the dictionary was decoded from.
+        return {str(key): jsonSafe(item) for key, item in value.items() if key != "raw"}
+    if isinstance(value, (list, tuple)):
+        return [jsonSafe(item) for item in value]
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def createClient():
+    """Create a paho MQTT client, supporting both the 1.x and 2.x callback APIs."""
+    import paho.mqtt.client as mqtt
+    try:
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+    except AttributeError:
+        return mqtt.Client()
+
+
+class Spool:
+    """Ordered on-disk queue of (topic, payload, retain) messages waiting for the broker.  Safe to use from any thread.
+
+    Once closed, further calls do nothing (head() returns no messages), so a bridge thread still finishing a publish
+    during shutdown cannot fail; a message it published but could not remove is sent again next time.
+    """
+
+    def __init__(self, path, maxMessages=100000):
+        """Class instantiation.  Opens (or creates) the spool database."""
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.maxMessages = maxMessages
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY, topic TEXT NOT NULL, payload BLOB NOT NULL, retain INTEGER NOT NULL)")
+        self.db.commit()
+        self.count = self.db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def append(self, messages):
+        """Add messages to the end of the spool, dropping the oldest if it is full."""
+        with self.lock:
+            if self.db is None or not messages:
+                return
+            self.db.executemany("INSERT INTO spool (topic, payload, retain) VALUES (?, ?, ?)", [(topic, payload, int(retain)) for topic, payload, retain in messages])
+            self.count += len(messages)
+            if self.count > self.maxMessages:
+                self.db.execute("DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)", (self.count - self.maxMessages,))
+                self.count = self.maxMessages
+            self.db.commit()
+
+    def head(self, limit):
+        """Return up to limit of the oldest messages as (id, topic, payload, retain)."""
+        with self.lock:
+            if self.db is None:
+                return []
+            return self.db.execute("SELECT id, topic, payload, retain FROM spool ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+    def remove(self, lastId):
+        """Remove every message up to and including lastId."""
+        with self.lock:
+            if self.db is None:
+                return
+            removed = self.db.execute("DELETE FROM spool WHERE id <= ?", (lastId,)).rowcount
+            self.count -= removed
+            self.db.commit()
+
+    def close(self):
+        """Close the spool database."""
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+class MqttBridge:
+    """Publishes received packets and node updates to an MQTT broker from a background thread.
+
+    submitPacket() and submitNode() only append to an in-memory buffer, so they are safe to call from the radio reader
+    thread.  Every batch interval the bridge thread publishes the buffered packets as one message and the latest update
+    of each changed node.  Every batch is written to the disk spool before it is published and removed once the broker
+    acknowledges it, so batches are sent in order, survive an unreachable broker and are not lost if the program exits
+    while waiting for an acknowledgement.
+    """
+
+    def __init__(self, host, port=1883, prefix="meshtastic-desktop", spoolPath=":memory:", batchInterval=1.0,
+                 maxBuffer=10000, username=None, password=None, client=None, ackTimeout=10.0):
+        """Class instantiation.  client may be a paho-compatible client (e.g. an in-process stand-in); by default one is created."""
+        self.host = host
+        self.port = port
+        self.prefix = prefix.rstrip("/")
+        self.spoolPath = spoolPath
+        self.batchInterval = batchInterval
+        self.ackTimeout = ackTimeout
+        self.packets = deque(maxlen=maxBuffer)
+        self.nodes = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.connected = False
+        self.published = 0
+        self.spool = Spool(spoolPath)
+
+        self.client = client if client is not None else createClient()
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.on_connect = self._onConnect
+        self.client.on_disconnect = self._onDisconnect
+        self.client.reconnect_delay_set(1, 60)
+        self.client.connect_async(host, port)
+        self.client.loop_start()
+
+        self.thread = threading.Thread(target=self._run, name="mqtt", daemon=True)
+        self.thread.start()
+
+    def _onConnect(self, client, userdata, flags, rc, *args):
+        """paho callback - the broker accepted the connection."""
+        self.connected = rc == 0
+        self.wake.set()
+
+    def _onDisconnect(self, client, userdata, rc, *args):
+        """paho callback - the connection dropped.  paho reconnects on its own."""
+        self.connected = False
+
+    def submitPacket(self, packet):
+        """Queue a received packet for the next batch.  The oldest packets are dropped if the buffer is full."""
+        with self.lock:
+            self.packets.append(packet)
+
+    def submitNode(self, node):
+        """Queue a node update.  Only the latest update of each node within a batch is published."""
+        nodeId = node.get("user", {}).get("id") or "!%08x" % node.get("num", 0)
+        with self.lock:
+            self.nodes[nodeId] = node
+
+    def stop(self, timeout=2.0):
+        """Stop the bridge, spooling the current buffers.  Anything not yet acknowledged is already in the spool.
+
+        Waits at most timeout seconds for the bridge thread, which may be waiting for an acknowledgement; it is a daemon
+        thread, so it cannot keep the program from exiting.
+        """
+        self.stopping = True
+        self.wake.set()
+        self.thread.join(timeout)
+        self.spool.append(self._takeBatch())
+        self.spool.close()
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _takeBatch(self):
+        """Return the buffered packets and node updates as MQTT messages, emptying the buffers."""
+        with self.lock:
+            packets = list(self.packets)
+            self.packets.clear()
+            nodes, self.nodes = self.nodes, {}
+        messages = []
+        if packets:
+            messages.append((self.prefix + "/packets", json.dumps([jsonSafe(packet) for packet in packets]).encode("utf-8"), False))
+        for nodeId, node in nodes.items():
+            messages.append((self.prefix + "/nodes/" + nodeId, json.dumps(jsonSafe(node)).encode("utf-8"), True))
+        return messages
+
+    def _publish(self, topic, payload, retain):
+        """Publish one message with QoS 1 and wait for the broker's acknowledgement.  Returns True on success."""
+        if not self.connected:
+            return False
+        try:
+            info = self.client.publish(topic, payload, qos=1, retain=retain)
+            info.wait_for_publish(self.ackTimeout)
+            if not info.is_published():
+                return False
+        except (RuntimeError, ValueError, OSError):
+            return False
+        self.published += 1
+        return True
+
+    def _drain(self):
+        """Publish spooled messages in order, removing each once acknowledged, until the spool is empty, a publish fails
+        or the bridge is stopping."""
+        while self.spool.count and not self.stopping:
+            for rowId, topic, payload, retain in self.spool.head(100):
+                if self.stopping or not self._publish(topic, payload, bool(retain)):
+                    return
+                self.spool.remove(rowId)
+
+    def _run(self):
+        """Bridge thread loop."""
+        while not self.stopping:
+            self.wake.wait(self.batchInterval)
+            self.wake.clear()
+            if self.stopping:
+                return
+            self.spool.append(self._takeBatch())
+            self._drain()
@@ -7,36 +7,404 @@
 # This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-import meshtastic, platform, sys, os, folium, icons
+import alerts, argparse, export, itertools, meshtastic, math, platform, sys, os, time, icons, configcache, connection, lrucache, messageview, mqttbridge, nativemap, rfcoverage, segments, storage, topology
 
-from PySide6.QtCore import Qt, QAbstractListModel, QMargins, QObject, QPoint, QSize, QUrl, Signal, Slot
-from PySide6.QtGui import QAction, QColor, QFontMetrics, QIcon, QKeySequence
-from PySide6.QtWebEngineWidgets import QWebEngineView
+from pubsub import pub
+from storage import SENT, CH0, CH1, CH2, CH3, CH4, CH5, CH6, CH7
+from PySide6.QtCore import Qt, QAbstractListModel, QAbstractTableModel, QMargins, QModelIndex, QObject, QPoint, QPointF, QRunnable, QSettings, QSize, QStandardPaths, QThreadPool, QTimer, QUrl, Signal, Slot
+from PySide6.QtGui import QAction, QActionGroup, QColor, QFontMetrics, QIcon, QImage, QKeySequence, QPainter, QTextLayout, QTextOption
 from PySide6.QtWidgets import (
     QApplication,
     QComboBox,
+    QDialog,
+    QDialogButtonBox,
+    QFileDialog,
     QGridLayout,
+    QHBoxLayout,
+    QHeaderView,
     QLabel,
     QLineEdit,
-    QListView,
     QListWidget,
+    QListWidgetItem,
     QMainWindow,
     QMenu,
     QMenuBar,
+    QMessageBox,
+    QProgressDialog,
     QPushButton,
+    QStackedWidget,
     QStatusBar,
+    QStyledItemDelegate,
+    QTableView,
     QTabWidget,
     QTextEdit,
+    QTreeWidget,
+    QTreeWidgetItem,
     QVBoxLayout,
     QWidget
 )
 
+class RadioBridge(QObject):
+    """Relays meshtastic pubsub messages, which arrive on the radio reader thread, to Qt signals on the GUI thread."""
+    
+    adminReceived = Signal(dict)
+    textReceived = Signal(dict)
+    positionReceived = Signal(dict)
+    packetReceived = Signal(dict)
+    connectionLost = Signal(object)
+    alertRaised = Signal(object)
+    
+    def __init__(self):
+        """Class instantiation.  Inherits attributes from QObject."""
+        super().__init__()
+        self.alertEngine = None
+        self.mqttBridge = None
+        pub.subscribe(self._onAdmin, "meshtastic.receive.admin")
+        pub.subscribe(self._onText, "meshtastic.receive.text")
+        pub.subscribe(self._onPosition, "meshtastic.receive.position")
+        pub.subscribe(self._onPacket, "meshtastic.receive")
+        pub.subscribe(self._onConnectionLost, "meshtastic.connection.lost")
+        pub.subscribe(self._onNodeUpdated, "meshtastic.node.updated")
+        
+    def _onText(self, packet, interface):
+        """Forward a received text message packet."""
+        self.textReceived.emit(packet)
+        
+    def _onPosition(self, packet, interface):
+        """Forward a received position packet."""
+        self.positionReceived.emit(packet)
+        
+    def _onPacket(self, packet, interface):
+        """Forward every received packet.  pubsub delivers all meshtastic.receive.* subtopics to this listener."""
+        self.packetReceived.emit(packet)
+        # Alert rules are evaluated on the alert engine's own thread, not the GUI thread.
+        if self.alertEngine is not None:
+            self.alertEngine.submit(packet)
+        if self.mqttBridge is not None:
+            self.mqttBridge.submitPacket(packet)
+            
+    def _onNodeUpdated(self, node, interface):
+        """Pass node database updates to the MQTT bridge, if one is running."""
+        if self.mqttBridge is not None:
+            self.mqttBridge.submitNode(node)
+        
+    def _onConnectionLost(self, interface):
+        """Forward the loss of a radio connection (e.g. the USB cable was pulled)."""
+        self.connectionLost.emit(interface)
+        
+    def _onAdmin(self, packet, interface):
+        """Forward a received admin packet."""
+        self.adminReceived.emit(packet)
+
+class MessageListModel(QAbstractListModel):
+    """List model exposing one view (channel or direct-message conversation) of the MessageStore."""
+    
+    MessageRole = Qt.UserRole
+    
+    def __init__(self, store, parent=None):
+        """Class instantiation.  Inherits attributes from QAbstractListModel."""
+        super().__init__(parent)
+        self.store = store
+        self.view = store.activeView
+        self.rows = store.activate(self.view)
+        # The store appends to self.rows before the model hears about it, so the row count Qt sees is kept separately
+        # and only advanced between beginInsertRows() and endInsertRows().
+        self.count = len(self.rows)
+        
+    def setView(self, view):
+        """Switch to another view.  The view's row list is kept up to date by the store, so no history is rescanned."""
+        self.beginResetModel()
+        self.view = view
+        self.rows = self.store.activate(view)
+        self.count = len(self.rows)
+        self.endResetModel()
+        
+    def messageAdded(self, view):
+        """Notify the model that the store has appended a message to a view."""
+        if view != self.view or len(self.rows) == self.count:
+            return
+        self.beginInsertRows(QModelIndex(), self.count, len(self.rows) - 1)
+        self.count = len(self.rows)
+        self.endInsertRows()
+        
+    def rowCount(self, parent=QModelIndex()):
+        """Return the number of messages in the current view."""
+        return 0 if parent.isValid() else self.count
+        
+    def data(self, index, role=Qt.DisplayRole):
+        """Return the text (DisplayRole) or the stored Message (MessageRole) for a row."""
+        if not index.isValid():
+            return None
+        message = self.store.message(self.rows[index.row()])
+        if role == Qt.DisplayRole:
+            return message.text
+        if role == self.MessageRole:
+            return message
+        return None
+
+class NodeListModel(QAbstractTableModel):
+    """Table model for the Node List tab, showing each node's place in the mesh topology."""
+    
+    HEADERS = ["Node", "Name", "Hops", "Neighbors", "Best SNR", "Critical Relay"]
+    
+    def __init__(self, graph, nameFor, parent=None):
+        """Class instantiation.  Inherits attributes from QAbstractTableModel.  nameFor maps a node ID to a display name."""
+        super().__init__(parent)
+        self.graph = graph
+        self.nameFor = nameFor
+        self.nodes = []
+        
+    def refresh(self):
+        """Append nodes new to the graph and repaint the rest.  Only the rows on screen are actually re-read by the view."""
+        # The graph never forgets a node and dictionaries keep insertion order, so new nodes are always at the end.
+        new = list(itertools.islice(self.graph.adjacency, len(self.nodes), None))
+        if new:
+            self.beginInsertRows(QModelIndex(), len(self.nodes), len(self.nodes) + len(new) - 1)
+            self.nodes.extend(new)
+            self.endInsertRows()
+        if self.nodes:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.nodes) - 1, len(self.HEADERS) - 1))
+            
+    def rowCount(self, parent=QModelIndex()):
+        """Return the number of known nodes."""
+        return 0 if parent.isValid() else len(self.nodes)
+        
+    def columnCount(self, parent=QModelIndex()):
+        """Return the number of columns."""
+        return 0 if parent.isValid() else len(self.HEADERS)
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        """Return the column titles."""
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+        
+    def data(self, index, role=Qt.DisplayRole):
+        """Return one cell of the node table."""
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        node = self.nodes[index.row()]
+        column = index.column()
+        if column == 0:
+            return node
+        if column == 1:
+            return self.nameFor(node)
+        if column == 2:
+            hops = self.graph.hopCount(node)
+            return "" if hops is None else str(hops)
+        if column == 3:
+            return str(len(self.graph.neighbors(node)))
+        if column == 4:
+            snr = self.graph.bestSnr(node)
+            return "" if snr is None else "%.1f dB" % snr
+        return "Yes" if node in self.graph.articulationPoints() else ""
+
+class BubbleDelegate(QStyledItemDelegate):
+    """Paints messages as chat bubbles - received messages on the left, sent messages on the right.
+    
+    Text layouts and size hints are cached per (message id, view width, font) in a bounded LRU cache.  The MessageView
+    only asks for the size of rows it shows, so rows are laid out when they first come into view.
+    """
+    
+    def __init__(self, view, colors, bubblePadding, textPadding, cacheSize=2000):
+        """Class instantiation.  Inherits attributes from QStyledItemDelegate."""
+        super().__init__(view)
+        self.view = view
+        self.colors = colors
+        self.bubblePadding = bubblePadding
+        self.textPadding = textPadding
+        self.layouts = lrucache.LRUCache(cacheSize)
+        
+    def estimatedHeight(self, font):
+        """Return the height of a one-line bubble, used for rows that have not been laid out yet."""
+        return QFontMetrics(font).lineSpacing() + self.textPadding.top() + self.textPadding.bottom()
+        
+    def _textWidth(self, viewWidth):
+        """Return the width available for message text at a view width."""
+        return max(50, int(viewWidth * 0.75) - self.textPadding.left() - self.textPadding.right())
+        
+    def _layout(self, message, font, viewWidth):
+        """Return the cached (layout, size hint, text width) for a message, laying it out on a cache miss."""
+        key = (message.id, viewWidth, font.key())
+        entry = self.layouts.get(key)
+        if entry is not None:
+            return entry
+        layout = QTextLayout(message.text, font)
+        option = QTextOption()
+        option.setWrapMode(QTextOption.WrapAtWordBoundaryOrAnywhere)
+        layout.setTextOption(option)
+        height = 0.0
+        width = 0.0
+        layout.beginLayout()
+        while True:
+            line = layout.createLine()
+            if not line.isValid():
+                break
+            line.setLineWidth(self._textWidth(viewWidth))
+            line.setPosition(QPointF(0, height))
+            height += line.height()
+            width = max(width, line.naturalTextWidth())
+        layout.endLayout()
+        size = QSize(viewWidth, math.ceil(height) + self.textPadding.top() + self.textPadding.bottom())
+        entry = (layout, size, math.ceil(width))
+        self.layouts.put(key, entry)
+        return entry
+        
+    def sizeHint(self, option, index):
+        """Return the size of a row at the width of option.rect."""
+        return self._layout(index.data(MessageListModel.MessageRole), option.font, option.rect.width())[1]
+        
+    def paint(self, painter, option, index):
+        """Paint one message bubble."""
+        message = index.data(MessageListModel.MessageRole)
+        layout, size, textWidth = self._layout(message, option.font, option.rect.width())
+            
+        color = QColor(self.colors.get(SENT if message.sent else message.channel, self.colors[SENT]))
+        inset = QMargins(self.textPadding.left() - self.bubblePadding.left(), self.textPadding.top() - self.bubblePadding.top(),
+                         self.textPadding.right() - self.bubblePadding.right(), self.textPadding.bottom() - self.bubblePadding.bottom())
+        bubble = option.rect.marginsRemoved(self.bubblePadding)
+        bubbleWidth = textWidth + inset.left() + inset.right()
+        if message.sent:
+            bubble.setLeft(bubble.right() - bubbleWidth)
+        else:
+            bubble.setWidth(bubbleWidth)
+            
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(color)
+        painter.drawRoundedRect(bubble, 10, 10)
+        painter.setPen(Qt.black if color.lightness() > 140 else Qt.white)
+        layout.draw(painter, QPointF(bubble.left() + inset.left(), bubble.top() + inset.top()))
+        painter.restore()
+
+class ExportWorkerSignals(QObject):
+    """Signals emitted by an ExportWorker."""
+    
+    progress = Signal(int, int)
+    finished = Signal(int)
+    failed = Signal(str)
+
+class ExportWorker(QRunnable):
+    """Streams one history export to a file on a QThreadPool worker."""
+    
+    def __init__(self, dbPath, kind, fmt, path, compression=None):
+        """Class instantiation.  Inherits attributes from QRunnable."""
+        super().__init__()
+        self.dbPath = dbPath
+        self.kind = kind
+        self.fmt = fmt
+        self.path = path
+        self.compression = compression
+        self.cancelled = False
+        self.signals = ExportWorkerSignals()
+        
+    def cancel(self):
+        """Ask the export to stop at the next batch."""
+        self.cancelled = True
+        
+    def _progress(self, written, total):
+        """Report progress and tell the exporter whether to continue."""
+        self.signals.progress.emit(written, total)
+        return not self.cancelled
+        
+    def run(self):
+        """Run the export, removing the partial file if it is cancelled or fails."""
+        try:
+            written = export.export(self.dbPath, self.kind, self.fmt, self.path, self._progress, self.compression)
+        except Exception as e:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.signals.failed.emit("" if isinstance(e, export.Cancelled) else str(e))
+        else:
+            self.signals.finished.emit(written)
+
+class ConnectWorkerSignals(QObject):
+    """Signals emitted by a ConnectWorker."""
+    
+    connected = Signal(object, str)
+    failed = Signal(str)
+
+class ConnectWorker(QRunnable):
+    """Finds a Meshtastic device and opens an interface to it on a QThreadPool worker."""
+    
+    def __init__(self, tcpHosts, lastGood):
+        """Class instantiation.  Inherits attributes from QRunnable."""
+        super().__init__()
+        self.tcpHosts = tcpHosts
+        self.lastGood = lastGood
+        self.signals = ConnectWorkerSignals()
+        
+    def run(self):
+        """Probe every candidate device concurrently and connect to the first that answers."""
+        try:
+            target = connection.discover(connection.candidateTargets(self.tcpHosts), self.lastGood)
+            if target is None:
+                self.signals.failed.emit("No Meshtastic device found.")
+                return
+            self.signals.connected.emit(connection.openInterface(target), target)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+
+class SectionLoaderSignals(QObject):
+    """Signals emitted by a SectionLoader when it finishes."""
+    
+    loaded = Signal(str, str, dict)
+    failed = Signal(str, str, str)
+
+class SectionLoader(QRunnable):
+    """Reads one configuration section from the radio on a QThreadPool worker."""
+    
+    def __init__(self, interface, kind, name):
+        """Class instantiation.  Inherits attributes from QRunnable."""
+        super().__init__()
+        self.interface = interface
+        self.kind = kind
+        self.name = name
+        self.signals = SectionLoaderSignals()
+        
+    def run(self):
+        """Read the section and report the result."""
+        try:
+            values = configcache.readSection(self.interface, self.kind, self.name)
+        except Exception as e:
+            self.signals.failed.emit(self.kind, self.name, str(e))
+        else:
+            self.signals.loaded.emit(self.kind, self.name, values)
+
+class CoverageLoaderSignals(QObject):
+    """Signals emitted by a CoverageLoader when it finishes."""
+    
+    loaded = Signal(object)
+
+class CoverageLoader(QRunnable):
+    """Bins the stored position history into a coverage grid on a QThreadPool worker."""
+    
+    def __init__(self, dbPath):
+        """Class instantiation.  Inherits attributes from QRunnable."""
+        super().__init__()
+        self.dbPath = dbPath
+        self.signals = CoverageLoaderSignals()
+        
+    def run(self):
+        """Load the history into a new grid and hand it to the GUI thread."""
+        grid = rfcoverage.CoverageGrid()
+        try:
+            grid.load(self.dbPath)
+        except Exception:
+            pass        # Without the history the heatmap still fills in from live reports.
+        self.signals.loaded.emit(grid)
+
 class MainWindow(QMainWindow):
     """Defines the Main Window GUI for the application."""
-    def __init__(self):
-        """Class instantiation.  Inherits attributes from QMainWindow."""
+    def __init__(self, mapBackend="web", tcpHosts=(), mqttHost=None, mqttPrefix=None):
+        """Class instantiation.  Inherits attributes from QMainWindow.  mapBackend selects the Node Map renderer ("web" or "native");
+        tcpHosts lists network-connected radios to probe along with the serial ports; mqttHost ("host[:port]") enables the MQTT uplink."""
         super().__init__()
         
+        self.mapBackend = mapBackend
+        self.settings = QSettings("KE7KUS", "Meshtastic-Desktop")
+        self.tcpHosts = list(tcpHosts) or self.settings.value("connection/tcpHosts", [], type=list)
         self.title = "Meshtastic Desktop"
         self.left = 50
         self.top = 50
@@ -47,14 +415,45 @@ class MainWindow(QMainWindow):
         self.setWindowTitle(self.title)
         self.setGeometry(self.left, self.top, self.width, self.height)
         
+        # Connected Meshtastic interface (None until a radio is connected) and the radio configuration cache for it.
+        self.interface = None
+        self.bridge = RadioBridge()
+        self.configCache = configcache.ConfigCache(os.path.join(QStandardPaths.writableLocation(QStandardPaths.CacheLocation), "config"))
+        self.bridge.adminReceived.connect(self.onAdminReceived)
+        self.messageStore = storage.MessageStore(os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), "history.db"))
+        self.bridge.connectionLost.connect(self.onConnectionLost)
+        self.alertRulesPath = os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), "alerts.json")
+        # A malformed rules file must not keep the program from starting - run without rules and say why instead.
+        alertError = None
+        try:
+            self.bridge.alertEngine = alerts.AlertEngine(alerts.loadRules(self.alertRulesPath), self.bridge.alertRaised.emit)
+        except (ValueError, KeyError, TypeError) as e:
+            alertError = e
+            self.bridge.alertEngine = alerts.AlertEngine([], self.bridge.alertRaised.emit)
+        self.bridge.alertRaised.connect(self.onAlert)
+        QApplication.instance().aboutToQuit.connect(self.shutdown)
+        
+        # Connection state.  After a drop the radio is looked for again with jittered exponential backoff.
+        self.connecting = False
+        self.autoReconnect = True
+        self.reconnectAttempt = 0
+        self.connectStarted = 0.0
+        self.reconnectTimer = QTimer(self)
+        self.reconnectTimer.setSingleShot(True)
+        self.reconnectTimer.timeout.connect(self.connectRadio)
+        
         self._createActions()
         self._createMenuBar()
         self._createStatusBar()
+        self._startMqtt(mqttHost or self.settings.value("mqtt/host"), mqttPrefix or self.settings.value("mqtt/prefix", "meshtastic-desktop"))
+        if alertError is not None:
+            self.statusbar.showMessage("Alert rules disabled - could not load %s: %s" % (self.alertRulesPath, alertError), 30000)
         
         self.tab_widget = TabWidget(self)
         self.setCentralWidget(self.tab_widget)
         
         self.show()
+        self.connectRadio()
         
     def _createActions(self):
         """Define MainWindow menu actions."""
@@ -81,6 +480,19 @@ class MainWindow(QMainWindow):
         self.saveAsAction.setShortcut(QKeySequence.SaveAs)
         self.saveAsAction.setStatusTip("Save the configuration to a new file...")
         
+        # Export - stream message history, node tracks or telemetry to a file
+        self.exportMessagesAction = QAction("Export &Messages...", self)
+        self.exportMessagesAction.setStatusTip("Export the message history to a CSV file.")
+        self.exportMessagesAction.triggered.connect(lambda:self.exportHistory("messages"))
+        
+        self.exportTracksAction = QAction("Export Node &Tracks...", self)
+        self.exportTracksAction.setStatusTip("Export node position tracks to a CSV, GeoJSON or GPX file.")
+        self.exportTracksAction.triggered.connect(lambda:self.exportHistory("tracks"))
+        
+        self.exportTelemetryAction = QAction("Export Te&lemetry...", self)
+        self.exportTelemetryAction.setStatusTip("Export node telemetry to a CSV file.")
+        self.exportTelemetryAction.triggered.connect(lambda:self.exportHistory("telemetry"))
+        
         # Exit - quit the program
         self.exitAction = QAction(QIcon(":/icons/cross.png"), "&Exit", self)
         self.exitAction.setShortcut(QKeySequence.Quit)
@@ -104,9 +516,40 @@ class MainWindow(QMainWindow):
         self.pasteAction.setShortcut(QKeySequence.Paste)
         self.pasteAction.setStatusTip("Paste the contents of the clipboard.")
         
+        # Connect - search for a Meshtastic radio and connect to it
+        self.connectAction = QAction(QIcon(":/icons/arrow-000-medium.png"), "C&onnect", self)
+        self.connectAction.setStatusTip("Search the serial ports and configured network hosts for a Meshtastic radio and connect to it.")
+        self.connectAction.triggered.connect(self.connectRadio)
+        
+        # Disconnect - close the radio connection and stop reconnecting
+        self.disconnectAction = QAction("&Disconnect", self)
+        self.disconnectAction.setStatusTip("Disconnect from the Meshtastic radio.")
+        self.disconnectAction.setEnabled(False)
+        self.disconnectAction.triggered.connect(self.disconnectRadio)
+        
         # Radio Configuration - configure the Meshtastic radio hardware
         self.radioConfigAction = QAction(QIcon(":/icons/wrench.png"), "&Radio Configuration...", self)
         self.radioConfigAction.setStatusTip("Change configuration settings for the connected Meshtastic radio.")
+        self.radioConfigAction.triggered.connect(self.openRadioConfig)
+        
+        #---VIEW MENU---#
+        
+        # Coverage - overlay the Node Map with the mean SNR or RSSI of the position reports received from each area
+        self.coverageSnrAction = QAction("Coverage Heatmap (&SNR)", self)
+        self.coverageSnrAction.setStatusTip("Show the mean SNR of received position reports on the Node Map.")
+        self.coverageRssiAction = QAction("Coverage Heatmap (&RSSI)", self)
+        self.coverageRssiAction.setStatusTip("Show the mean RSSI of received position reports on the Node Map.")
+        self.coverageGroup = QActionGroup(self)
+        self.coverageGroup.setExclusionPolicy(QActionGroup.ExclusionPolicy.ExclusiveOptional)
+        for action, metric in ((self.coverageSnrAction, "snr"), (self.coverageRssiAction, "rssi")):
+            action.setCheckable(True)
+            action.setData(metric)
+            action.setEnabled(rfcoverage.available())
+            self.coverageGroup.addAction(action)
+        if not rfcoverage.available():
+            self.coverageSnrAction.setStatusTip("Install NumPy (pip3 install numpy) to show coverage heatmaps.")
+            self.coverageRssiAction.setStatusTip("Install NumPy (pip3 install numpy) to show coverage heatmaps.")
+        self.coverageGroup.triggered.connect(self.onCoverageToggled)
         
         #---HELP MENU---#
         
@@ -130,6 +573,10 @@ class MainWindow(QMainWindow):
         fileMenu.addAction(self.openAction)
         fileMenu.addAction(self.saveAction)
         fileMenu.addAction(self.saveAsAction)
+        exportMenu = fileMenu.addMenu("&Export")
+        exportMenu.addAction(self.exportMessagesAction)
+        exportMenu.addAction(self.exportTracksAction)
+        exportMenu.addAction(self.exportTelemetryAction)
         fileMenu.addSeparator()
         fileMenu.addAction(self.exitAction)
         
@@ -139,19 +586,295 @@ class MainWindow(QMainWindow):
         editMenu.addAction(self.copyAction)
         editMenu.addAction(self.pasteAction)
         editMenu.addSeparator()
+        editMenu.addAction(self.connectAction)
+        editMenu.addAction(self.disconnectAction)
         editMenu.addAction(self.radioConfigAction)
         
+        #---VIEW MENU---#
+        viewMenu = self.menuBar.addMenu("&View")
+        viewMenu.addAction(self.coverageSnrAction)
+        viewMenu.addAction(self.coverageRssiAction)
+        
         #---HELP MENU---#
         helpMenu = self.menuBar.addMenu("&Help")
         helpMenu.addAction(self.helpContentAction)
         helpMenu.addAction(self.aboutAction)
         
+    def onCoverageToggled(self, action):
+        """Show the selected coverage heatmap on the Node Map, or hide it if the checked entry was unchecked."""
+        checked = self.coverageGroup.checkedAction()
+        self.tab_widget.setCoverageMetric(checked.data() if checked is not None else None)
+        
     def _createStatusBar(self):
         """Constructs the program's status bar at the bottom of the main window."""
         
         self.statusbar = QStatusBar()
         self.setStatusBar(self.statusbar)
         self.statusbar.showMessage("Ready.", 10)
+        self.connectionLabel = QLabel("Not connected")
+        self.statusbar.addPermanentWidget(self.connectionLabel)
+        
+    def _startMqtt(self, host, prefix):
+        """Start uplinking received traffic to an MQTT broker, if one is configured and paho-mqtt is installed."""
+        if not host:
+            return
+        host, _, port = host.partition(":")
+        try:
+            self.bridge.mqttBridge = mqttbridge.MqttBridge(host, int(port or 1883), prefix,
+                                                           os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), "mqtt-spool.db"),
+                                                           username=self.settings.value("mqtt/username"), password=self.settings.value("mqtt/password"))
+        except ImportError:
+            self.statusbar.showMessage("MQTT uplink disabled - install paho-mqtt to use it.", 10000)
+            
+    def shutdown(self):
+        """Stop the MQTT uplink (spooling unsent traffic) and close the radio connection before the program exits."""
+        if self.bridge.mqttBridge is not None:
+            self.bridge.mqttBridge.stop()
+            self.bridge.mqttBridge = None
+        if self.interface is not None:
+            self.interface.close()
+            self.interface = None
+        
+    def connectRadio(self):
+        """Look for a radio in the background.  The last device that worked is tried first."""
+        if self.connecting or self.interface is not None:
+            return
+        self.connecting = True
+        self.autoReconnect = True
+        self.reconnectTimer.stop()
+        self.connectStarted = time.monotonic()
+        self.connectionLabel.setText("Searching for radio...")
+        worker = ConnectWorker(self.tcpHosts, self.settings.value("connection/lastGood"))
+        worker.signals.connected.connect(self.onConnected)
+        worker.signals.failed.connect(self.onConnectFailed)
+        QThreadPool.globalInstance().start(worker)
+        
+    def disconnectRadio(self):
+        """Close the radio connection and stop reconnecting."""
+        self.autoReconnect = False
+        self.reconnectTimer.stop()
+        if self.interface is not None:
+            self.interface.close()
+            self.interface = None
+        self.disconnectAction.setEnabled(False)
+        self.connectionLabel.setText("Not connected")
+        
+    def onConnected(self, interface, target):
+        """Start using a newly opened interface and report how long it took to connect."""
+        self.connecting = False
+        if not self.autoReconnect:
+            # Disconnect was chosen while the search was running.
+            interface.close()
+            return
+        self.interface = interface
+        self.reconnectAttempt = 0
+        self.settings.setValue("connection/lastGood", target)
+        self.configCache.select(*configcache.deviceIdentity(interface))
+        self.tab_widget.topology.setRoot(interface.myInfo.my_node_num)
+        self.disconnectAction.setEnabled(True)
+        self.connectionLabel.setText("Connected: " + connection.parseTarget(target)[1])
+        self.statusbar.showMessage("Connected to %s in %.1f s." % (connection.parseTarget(target)[1], time.monotonic() - self.connectStarted), 10000)
+        
+    def onConnectFailed(self, error):
+        """Schedule another search after a failed one."""
+        self.connecting = False
+        self._scheduleReconnect(error)
+        
+    @Slot(object)
+    def onAlert(self, alert):
+        """Show an alert raised by the alert rules."""
+        self.statusbar.showMessage("ALERT - %s: %s" % (alerts.ruleName(alert.rule), self.tab_widget._nodeName(alert.node)), 30000)
+        self.tab_widget.addAlert(alert)
+        
+    @Slot(object)
+    def onConnectionLost(self, interface):
+        """Drop a lost interface and start looking for the radio again."""
+        if interface is not self.interface:
+            return
+        self.interface = None
+        self.disconnectAction.setEnabled(False)
+        try:
+            interface.close()
+        except Exception:
+            pass
+        self._scheduleReconnect("Connection to the radio was lost.")
+        
+    def _scheduleReconnect(self, reason):
+        """Retry the connection after a jittered, exponentially growing delay."""
+        if not self.autoReconnect:
+            self.connectionLabel.setText("Not connected")
+            return
+        delay = connection.backoffDelay(self.reconnectAttempt)
+        self.reconnectAttempt += 1
+        self.connectionLabel.setText("Not connected - retrying in %d s" % round(delay))
+        self.statusbar.showMessage(reason, 10000)
+        self.reconnectTimer.start(int(delay * 1000))
+        
+    def openRadioConfig(self):
+        """Open the Radio Configuration dialog.  Cached sections are shown immediately and refreshed in the background."""
+        if self.interface is not None:
+            self.configCache.select(*configcache.deviceIdentity(self.interface))
+        dialog = RadioConfigDialog(self, self.configCache, self.interface)
+        dialog.exec()
+        
+    def exportHistory(self, kind):
+        """Ask for an output file and export one history to it in the background, with progress and cancellation."""
+        filters = {
+            "csv": "CSV files (*.csv *.csv.gz *.csv.bz2)",
+            "geojson": "GeoJSON files (*.geojson *.geojson.gz *.geojson.bz2)",
+            "gpx": "GPX files (*.gpx *.gpx.gz *.gpx.bz2)",
+        }
+        path, selected = QFileDialog.getSaveFileName(self, "Export " + kind.title(), kind + ".csv",
+                                                     ";;".join(filters[fmt] for fmt in export.FORMATS[kind]))
+        if not path:
+            return
+        # The format comes from the file extension (ignoring a compression suffix), falling back to the selected filter.
+        name, compression = export.splitCompression(path)
+        fmt = next((fmt for fmt in export.FORMATS[kind] if name.endswith("." + fmt)), None)
+        if fmt is None:
+            fmt = next(fmt for fmt in export.FORMATS[kind] if filters[fmt] == selected)
+            
+        worker = ExportWorker(self.messageStore.path, kind, fmt, path, compression)
+        progress = QProgressDialog("Exporting " + kind + "...", "Cancel", 0, 0, self)
+        progress.setWindowTitle("Export")
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(worker.cancel)
+        
+        def onProgress(written, total):
+            progress.setMaximum(total)
+            progress.setValue(written)
+            
+        def onFinished(written):
+            progress.reset()
+            self.statusbar.showMessage("Exported %d %s rows to %s." % (written, kind, path), 10000)
+            
+        def onFailed(error):
+            progress.reset()
+            if error:
+                QMessageBox.warning(self, "Export", "The %s export failed: %s" % (kind, error))
+            else:
+                self.statusbar.showMessage("Export cancelled.", 5000)
+                
+        worker.signals.progress.connect(onProgress)
+        worker.signals.finished.connect(onFinished)
+        worker.signals.failed.connect(onFailed)
+        QThreadPool.globalInstance().start(worker)
+        
+    @Slot(dict)
+    def onAdminReceived(self, packet):
+        """Invalidate cached configuration sections changed by an admin message (e.g. from another client)."""
+        admin = packet.get("decoded", {}).get("admin", {})
+        for kind, name in configcache.changedSections(admin):
+            self.configCache.invalidate(kind, name)
+
+class RadioConfigDialog(QDialog):
+    """Radio Configuration dialog.  Each section page is built and loaded only when it is first viewed.
+
+    A page opens instantly with the cached values and is re-read from the radio in the background once per dialog
+    session, as the radio does not tell us when another client changes its configuration.
+    """
+    
+    def __init__(self, parent, cache, interface):
+        """Class instantiation.  Inherits attributes from QDialog."""
+        super().__init__(parent)
+        
+        self.cache = cache
+        self.interface = interface
+        self.pages = {}
+        self.loading = set()
+        self.refreshed = set()          # sections read from the radio (or being read) since the dialog opened
+        
+        self.setWindowTitle("Radio Configuration")
+        self.setWindowIcon(QIcon(":/icons/wrench.png"))
+        self.resize(600, 450)
+        
+        self.sectionList = QListWidget(self)
+        self.sectionList.insertItems(0, [configcache.sectionTitle(kind, name) for kind, name in configcache.SECTIONS])
+        self.sectionList.setMaximumWidth(180)
+        self.stack = QStackedWidget(self)
+        for i in range(len(configcache.SECTIONS)):
+            self.stack.addWidget(QWidget())
+        self.sectionList.currentRowChanged.connect(self.showSection)
+        
+        self.status = QLabel(self)
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Close, self)
+        self.buttons.rejected.connect(self.reject)
+        
+        self.layout = QVBoxLayout(self)
+        self.body = QHBoxLayout()
+        self.body.addWidget(self.sectionList)
+        self.body.addWidget(self.stack)
+        self.layout.addLayout(self.body)
+        self.layout.addWidget(self.status)
+        self.layout.addWidget(self.buttons)
+        
+        self.sectionList.setCurrentRow(0)
+        
+    def showSection(self, row):
+        """Show a section page, building it from the cache and refreshing it from the radio on its first viewing."""
+        kind, name = configcache.SECTIONS[row]
+        if (kind, name) not in self.pages:
+            page = QTreeWidget()
+            page.setHeaderLabels(["Setting", "Value"])
+            page.setColumnWidth(0, 200)
+            self.stack.removeWidget(self.stack.widget(row))
+            self.stack.insertWidget(row, page)
+            self.pages[(kind, name)] = page
+            values = self.cache.get(kind, name)
+            if values is not None:
+                self._fill(page, values)
+        self.stack.setCurrentIndex(row)
+        
+        if self.cache.isStale(kind, name) or (kind, name) not in self.refreshed:
+            self._refresh(kind, name)
+        else:
+            self.status.clear()
+            
+    def _refresh(self, kind, name):
+        """Queue a background read of a section from the radio."""
+        if self.interface is None:
+            self.status.setText("No radio connected - showing cached values." if self.cache.get(kind, name) is not None else "No radio connected.")
+            return
+        if (kind, name) in self.loading:
+            return
+        self.loading.add((kind, name))
+        self.refreshed.add((kind, name))
+        self.status.setText("Reading " + configcache.sectionTitle(kind, name) + " from the radio...")
+        loader = SectionLoader(self.interface, kind, name)
+        loader.signals.loaded.connect(self.onSectionLoaded)
+        loader.signals.failed.connect(self.onSectionFailed)
+        QThreadPool.globalInstance().start(loader)
+        
+    @Slot(str, str, dict)
+    def onSectionLoaded(self, kind, name, values):
+        """Store a freshly read section and update its page."""
+        self.loading.discard((kind, name))
+        self.cache.put(kind, name, values)
+        self._fill(self.pages[(kind, name)], values)
+        if configcache.SECTIONS[self.stack.currentIndex()] == (kind, name):
+            self.status.clear()
+            
+    @Slot(str, str, str)
+    def onSectionFailed(self, kind, name, error):
+        """Report a section that could not be read.  It is tried again the next time it is viewed."""
+        self.loading.discard((kind, name))
+        self.refreshed.discard((kind, name))
+        self.status.setText(error)
+        
+    def _fill(self, page, values):
+        """Populate a section page from a dictionary of settings."""
+        page.clear()
+        self._addItems(page.invisibleRootItem(), values)
+        page.expandAll()
+        
+    def _addItems(self, parent, values):
+        """Recursively add settings (and nested settings) under a tree item."""
+        for key, value in values.items():
+            item = QTreeWidgetItem(parent, [key.replace("_", " ")])
+            if isinstance(value, dict):
+                self._addItems(item, value)
+            else:
+                item.setText(1, str(value))
 
 class TabWidget(QWidget):
     """Controls and interfaces for the tabbed portion of the user interface."""
@@ -160,11 +883,31 @@ class TabWidget(QWidget):
         """Class instatiation.  Inherits attributes from QWidget."""
         super().__init__(parent)
         
+        self.mainWindow = parent
+        self.store = parent.messageStore
+        self.reassembler = segments.Reassembler()
+        self.sendQueue = segments.SendQueue(self._transmit)
+        parent.bridge.textReceived.connect(self.onTextReceived)
+        parent.bridge.positionReceived.connect(self.onPositionReceived)
+        parent.bridge.packetReceived.connect(self.onPacketReceived)
+        self.topology = topology.TopologyGraph()
+        self.topologyVersion = self.topology.version
+        
+        # RF coverage grid (needs NumPy).  The stored history is binned on a worker; live reports are added as they arrive.
+        self.coverage = None
+        self.coverageMetric = None
+        self.coverageKey = None
+        if rfcoverage.available():
+            self.coverage = rfcoverage.CoverageGrid()
+            loader = CoverageLoader(self.store.path)
+            loader.signals.loaded.connect(self.onCoverageLoaded)
+            QThreadPool.globalInstance().start(loader)
+        
         self.layout = QVBoxLayout(self)
         self.message = QWidget()
         self.filexfr = QWidget()
         self.nodelist = QWidget()
-        self.nodemap = QWidget()
+        self.nodemap = self._createNodeMap(parent.mapBackend)
         
         self.tabs = QTabWidget()
         self.tabs.resize(600,600)
@@ -176,18 +919,32 @@ class TabWidget(QWidget):
         self.message.layout.setHorizontalSpacing(10)
         self.message.layout.setVerticalSpacing(10)
         
-        self.txtWindow = QListView(self)
-        # TODO:  Listen for incoming messages and display in this ListView (https://forum.pythonguis.com/t/cloud-around-the-text-in-qtextedit/318)
-        # TODO:  Alternating justification (RX msgs - left justified / TX msgs - right justified)
-        # TODO:  Color-differentiated bubbles for incoming text on each configured channel
+        # One entry per channel and per direct-message peer.  Switching entries swaps the model onto that view's row list.
+        self.viewList = QListWidget(self)
+        self.viewItems = {}
+        for view in self.store.views:
+            self._addViewItem(view)
+        self.viewList.currentItemChanged.connect(self.onViewChanged)
+        
+        self.txtModel = MessageListModel(self.store, self)
+        self.txtWindow = messageview.MessageView(self)
+        self.txtWindow.setModel(self.txtModel)
         self.bubbleColors = {SENT:"#797C85", CH0:"#37517C", CH1:"#E8D2AE", CH2:"#D7B29D", CH3:"#CB8589", CH4:"#796465", CH5:"#EB8658", CH6:"#222328", CH7:"#DDE8B9"} # Color palette created at https://coolors.co
         self.bubblePadding = QMargins(15,5,15,5)
         self.textPadding = QMargins(25,15,25,15)
+        self.txtDelegate = BubbleDelegate(self.txtWindow, self.bubbleColors, self.bubblePadding, self.textPadding)
+        self.txtWindow.setItemDelegate(self.txtDelegate)
+        self.txtWindow.setEstimatedRowHeight(self.txtDelegate.estimatedHeight(self.txtWindow.font()))
         # TODO:  Display color-coding legend with configured channels below the txtInput line.
         # TODO:  Create message delete function (i.e. remove one item from ListView)
         # TODO:  If hearing another node repeat a sent message, generate a "send successful" indicator
         #        - If ACK received from destination node, generate a "message received" indicator
         
+        # Alerts raised by the rules in alerts.json, newest first.
+        self.alertList = QListWidget(self)
+        self.alertList.setMaximumHeight(80)
+        self.alertList.setVisible(False)
+        
         self.txtInput = QLineEdit(self)
         self.txtInput.returnPressed.connect(lambda:self.sendText())
         
@@ -203,33 +960,247 @@ class TabWidget(QWidget):
         self.sendBtn = QPushButton(QIcon(":/icons/mail--arrow.png"), "Send Message", self)
         self.sendBtn.clicked.connect(lambda:self.sendText())
         
-        self.message.layout.addWidget(self.txtWindow, 1, 1, 3, 12)
+        self.message.layout.addWidget(self.viewList, 1, 1, 3, 2)
+        self.message.layout.addWidget(self.txtWindow, 1, 3, 3, 10)
+        self.message.layout.addWidget(self.alertList, 4, 1, 1, 12)
         self.message.layout.addWidget(self.txtInput, 5, 1, 1, 9)
         self.message.layout.addWidget(self.chList, 5, 10, 1, 1)
         self.message.layout.addWidget(self.sendBtn, 5, 11, 1, 2)
         
         self.message.setLayout(self.message.layout)
+        self.viewList.setCurrentItem(self.viewItems[self.store.activeView])
         
         #---FILE TRANSFER TAB---#        
         self.tabs.addTab(self.filexfr, "&File Transfer")
         
         #---NODE LIST TAB---#
         self.tabs.addTab(self.nodelist, "Node &List")
+        self.nodelist.layout = QVBoxLayout()
+        self.nodeModel = NodeListModel(self.topology, self._nodeName, self)
+        self.nodeTable = QTableView(self)
+        self.nodeTable.setModel(self.nodeModel)
+        self.nodeTable.verticalHeader().setVisible(False)
+        self.nodeTable.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.nodeTable.horizontalHeader().setStretchLastSection(True)
+        self.nodelist.layout.addWidget(self.nodeTable)
+        self.nodelist.setLayout(self.nodelist.layout)
         
         #---NODE MAP TAB---#
         self.tabs.addTab(self.nodemap, "Node Ma&p")
         
         self.layout.addWidget(self.tabs)
+        
+        # Topology views are refreshed on a timer rather than per packet, so a burst of traffic costs one repaint.
+        self.topologyTimer = QTimer(self)
+        self.topologyTimer.timeout.connect(self.refreshTopology)
+        self.topologyTimer.start(2000)
+        
+        # Long messages whose segments never all arrived are shown with the gaps marked once they time out.
+        self.reassemblyTimer = QTimer(self)
+        self.reassemblyTimer.timeout.connect(self.expireSegments)
+        self.reassemblyTimer.start(10000)
+        
+        # The coverage overlay is re-rendered for the visible area when the map moves or new reports arrive.
+        self.coverageTimer = QTimer(self)
+        self.coverageTimer.timeout.connect(self.refreshCoverage)
+        self.coverageTimer.start(1000)
     
+    def _createNodeMap(self, backend):
+        """Create the Node Map widget.  Both backends provide the same node, track, topology overlay and centerMap methods."""
+        if backend == "native":
+            nodeMap = nativemap.NativeMap(self, os.path.join(QStandardPaths.writableLocation(QStandardPaths.CacheLocation), "tiles"))
+        else:
+            # Imported here so the Chromium process is only started when the web map is selected.
+            import webmap
+            nodeMap = webmap.WebMap(self, os.path.join(QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), "map.html"))
+        nodeMap.centerMap(32.93, -105.81, 14)
+        return nodeMap
+        
+    def _nodeName(self, nodeId):
+        """Return the long name a node has reported, or its ID if it is unknown."""
+        interface = self.window().interface
+        node = interface.nodes.get(nodeId) if interface is not None and interface.nodes else None
+        return node.get("user", {}).get("longName", nodeId) if node else nodeId
+        
+    @Slot(dict)
+    def onPositionReceived(self, packet):
+        """Move a node's map marker and extend its track."""
+        position = packet.get("decoded", {}).get("position", {})
+        lat, lon = position.get("latitude"), position.get("longitude")
+        if lat is None or lon is None:
+            return
+        nodeId = packet.get("fromId") or "!%08x" % packet.get("from", 0)
+        self.store.addPosition(packet)
+        self.nodemap.setNode(nodeId, lat, lon, self._nodeName(nodeId))
+        self.nodemap.addTrackPoint(nodeId, lat, lon)
+        # A relayed report's SNR/RSSI is that of the last hop, not of the reporting node's position.
+        if self.coverage is not None and packet.get("hopStart", packet.get("hopLimit")) == packet.get("hopLimit"):
+            self.coverage.add(lat, lon, packet.get("rxSnr"), packet.get("rxRssi"))
+        
+    @Slot(dict)
+    def onPacketReceived(self, packet):
+        """Update the mesh topology graph from any received packet."""
+        interface = self.window().interface
+        myId = None
+        if interface is not None and interface.myInfo is not None:
+            myId = topology.nodeId(interface.myInfo.my_node_num)
+            if self.topology.root != myId:
+                self.topology.setRoot(myId)
+        self.topology.observePacket(packet, myId, knownNodes=list(interface.nodes or {}) if interface is not None else ())
+        if "telemetry" in packet.get("decoded", {}):
+            self.store.addTelemetry(packet)
+        
+    def refreshTopology(self):
+        """Expire old links and push topology changes to the Node List and Node Map."""
+        self.topology.expire()
+        if self.topology.version == self.topologyVersion:
+            return
+        self.topologyVersion = self.topology.version
+        self.nodeModel.refresh()
+        self.nodemap.setLinks(self.topology.links(minQuality=0.05))
+        self.nodemap.setCriticalNodes(self.topology.articulationPoints())
+        
+    def onCoverageLoaded(self, grid):
+        """Add the binned position history to the coverage grid."""
+        self.coverage.merge(grid)
+        
+    def setCoverageMetric(self, metric):
+        """Show the coverage heatmap of a metric ("snr" or "rssi") on the Node Map, or hide it if metric is None."""
+        self.coverageMetric = metric
+        self.coverageKey = None
+        if metric is None:
+            self.nodemap.setOverlay(None)
+        else:
+            self.refreshCoverage()
+            
+    def refreshCoverage(self):
+        """Re-render the coverage overlay for the visible map area if the area or the observations changed."""
+        if self.coverageMetric is None:
+            return
+        bounds = self.nodemap.visibleBounds()
+        key = (self.coverageMetric, bounds, self.coverage.version)
+        if bounds is None or key == self.coverageKey:
+            return
+        self.coverageKey = key
+        rendered = self.coverage.render(*bounds, metric=self.coverageMetric)
+        if rendered is None:
+            self.nodemap.setOverlay(None)
+            return
+        pixels, area = rendered
+        height, width = pixels.shape[:2]
+        image = QImage(pixels.tobytes(), width, height, width * 4, QImage.Format_RGBA8888).copy()
+        self.nodemap.setOverlay(image, *area)
+        
+    def addAlert(self, alert, maxAlerts=200):
+        """Add an alert to the top of the alert list, dropping the oldest beyond maxAlerts."""
+        item = QListWidgetItem("%s  %s - %s: %s" % (time.strftime("%H:%M:%S", time.localtime(alert.time)), alerts.ruleName(alert.rule),
+                                                  self._nodeName(alert.node), alert.detail))
+        item.setForeground(QColor("#D0021B"))
+        self.alertList.insertItem(0, item)
+        while self.alertList.count() > maxAlerts:
+            self.alertList.takeItem(self.alertList.count() - 1)
+        self.alertList.setVisible(True)
+        
+    def _addViewItem(self, view):
+        """Add a channel or direct-message entry to the view list."""
+        item = QListWidgetItem(self.viewList)
+        item.setData(Qt.UserRole, view)
+        self.viewItems[view] = item
+        self._updateViewItem(view)
+        
+    def _updateViewItem(self, view):
+        """Refresh the label (including the unread count) of one view list entry."""
+        kind, key = view.split(":", 1)
+        label = ("Channel " + key) if kind == "ch" else key
+        unread = self.store.unreadCount(view)
+        self.viewItems[view].setText(label + (" (%d)" % unread if unread else ""))
+        
+    def onViewChanged(self, current, previous):
+        """Show the messages for the selected channel or conversation."""
+        if current is None:
+            return
+        view = current.data(Qt.UserRole)
+        self.txtModel.setView(view)
+        self._updateViewItem(view)
+        kind, key = view.split(":", 1)
+        if kind == "ch":
+            self.chList.setCurrentIndex(int(key))
+        self.txtWindow.scrollToBottom()
+        
+    def _messageAdded(self, view):
+        """Update the message list and view list after a message is stored."""
+        if view not in self.viewItems:
+            self._addViewItem(view)
+        self.txtModel.messageAdded(view)
+        self._updateViewItem(view)
+        if view == self.txtModel.view:
+            self.txtWindow.scrollToBottom()
+        
+    @Slot(dict)
+    def onTextReceived(self, packet):
+        """Store a received text message and show it if its view is selected."""
+        sender = packet.get("fromId") or "!%08x" % packet.get("from", 0)
+        received = packet.get("decoded", {}).get("text", "")
+        text = self.reassembler.add(sender, received, context=packet)
+        if text is None:
+            return
+        if text != received:
+            packet = dict(packet, decoded=dict(packet["decoded"], text=text))
+        self._storeReceived(packet)
+        
+    def _storeReceived(self, packet):
+        """Store a received (and, if segmented, reassembled) text message."""
+        interface = self.window().interface
+        myId = interface.getMyUser().get("id") if interface is not None else None
+        message, view = self.store.addPacket(packet, myId)
+        self._messageAdded(view)
+        
+    def expireSegments(self):
+        """Show the parts received of long messages that timed out before all of their segments arrived."""
+        for packet, text in self.reassembler.expire():
+            self._storeReceived(dict(packet, decoded=dict(packet["decoded"], text=text + " (incomplete)")))
+            
+    def _transmit(self, payload, destinationId, channelIndex):
+        """Send one text packet.  Called from the send queue thread."""
+        self.mainWindow.interface.sendText(payload, destinationId=destinationId, channelIndex=channelIndex)
+        
     def sendText(self):
         """Send Meshtastic text message."""
-        # TODO:  Send text message over Meshtastic SerialInterface
-        # TODO:  Investigate using MeshInterface.sendData due to being able to assign a channel number using that format
-        print("Message sent: " + self.txtInput.text())
+        text = self.txtInput.text()
+        if not text:
+            return
+        interface = self.window().interface
+        if interface is None:
+            self.window().statusbar.showMessage("Not connected to a radio - message not sent.", 5000)
+            return
+        kind, key = self.txtModel.view.split(":", 1)
+        peer = key if kind == "dm" else None
+        try:
+            payloads = segments.split(text)
+        except ValueError as e:
+            self.window().statusbar.showMessage(str(e), 5000)
+            return
+        self.sendQueue.put(payloads, peer or storage.BROADCAST_ID, self.chList.currentIndex())
+        message, view = self.store.add(text, channel=self.chList.currentIndex(), sent=True, peer=peer)
+        self._messageAdded(view)
         self.txtInput.clear()
         
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    parser = argparse.ArgumentParser(description="Meshtastic Desktop")
+    parser.add_argument("--map", choices=["web", "native"], default=os.environ.get("MT_DESKTOP_MAP", "web"),
+                        help="Node Map renderer: web (folium/QtWebEngine) or native (QGraphicsView, much lighter)")
+    parser.add_argument("--host", action="append", default=[], metavar="HOST[:PORT]",
+                        help="network-connected radio to probe along with the serial ports (may be repeated)")
+    parser.add_argument("--mqtt", metavar="HOST[:PORT]", help="MQTT broker to uplink received packets and node updates to")
+    parser.add_argument("--mqtt-prefix", metavar="TOPIC", help="MQTT topic prefix (default meshtastic-desktop)")
+    args, qtArgs = parser.parse_known_args()
+    if args.map == "web":
+        # QtWebEngine must be imported before the QApplication is created.
+        import webmap
+    app = QApplication(sys.argv[:1] + qtArgs)
+    # QStandardPaths builds the cache and data directories (configuration cache, message history, ...) from these names.
+    app.setOrganizationName("KE7KUS")
+    app.setApplicationName("Meshtastic-Desktop")
+    window = MainWindow(args.map, args.host, args.mqtt, args.mqtt_prefix)
     sys.exit(app.exec())
         
\ No newline at end of file
@@ -0,0 +1,305 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Native QGraphicsView node map - a lightweight alternative to the QtWebEngine map
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import math, os, lrucache
+
+from PySide6.QtCore import Qt, QByteArray, QLineF, QPointF, QRectF, QTimer, QUrl
+from PySide6.QtGui import QBrush, QColor, QPainter, QPainterPath, QPen, QPixmap
+from PySide6.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+from PySide6.QtWidgets import QGraphicsEllipseItem, QGraphicsItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPixmapItem, QGraphicsScene, QGraphicsSimpleTextItem, QGraphicsView
+
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798
+TILE_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+LABEL_ZOOM = 12         # Node labels are hidden below this zoom level to keep the map readable and cheap to paint.
+TRACK_COLOR = "#EB8658"
+NODE_COLOR = "#37517C"
+CRITICAL_COLOR = "#D0021B"
+
+
+def lonLatToWorld(lon, lat):
+    """Convert a longitude/latitude to Web Mercator world coordinates, where the whole world is one zoom 0 tile."""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0 * TILE_SIZE
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * TILE_SIZE
+    return QPointF(x, y)
+
+
+def worldToLonLat(point):
+    """Convert Web Mercator world coordinates back to a (longitude, latitude) pair."""
+    lon = point.x() / TILE_SIZE * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * point.y() / TILE_SIZE))))
+    return lon, lat
+
+
+class NativeMap(QGraphicsView):
+    """Node map drawn with QGraphicsView using slippy-map tiles from a local tile cache.
+
+    Only the tiles covering the visible area at the current zoom level are kept in the scene.  Decoded tiles are held in
+    an LRU pixmap cache; tiles missing from the disk cache are downloaded (if a tile URL is set) and written to it.
+    """
+
+    def __init__(self, parent, tileDir, tileUrl=TILE_URL, minZoom=2, maxZoom=18, cacheSize=200):
+        """Class instantiation.  Inherits attributes from QGraphicsView."""
+        super().__init__(parent)
+
+        self.tileDir = tileDir
+        self.tileUrl = tileUrl
+        self.minZoom = minZoom
+        self.maxZoom = maxZoom
+        self.pixmaps = lrucache.LRUCache(cacheSize)
+        self.tileItems = {}
+        self.requests = set()
+        self.replies = {}
+        self.nodes = {}
+        self.tracks = {}
+        self.links = {}
+        self.nodeLinks = {}
+        self.critical = set()
+        self.overlay = None
+        self.labelsVisible = True
+        self.network = QNetworkAccessManager(self)
+        self.network.finished.connect(self._onTileDownloaded)
+
+        self.scene = QGraphicsScene(QRectF(0, 0, TILE_SIZE, TILE_SIZE), self)
+        self.setScene(self.scene)
+        self.setRenderHint(QPainter.Antialiasing)
+        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setBackgroundBrush(QColor("#DDDDDD"))
+
+        # Coalesce the many scroll/zoom/resize notifications of one user gesture into a single tile update.
+        self.updateTimer = QTimer(self)
+        self.updateTimer.setSingleShot(True)
+        self.updateTimer.timeout.connect(self.updateTiles)
+        self.horizontalScrollBar().valueChanged.connect(self.updateTimer.start)
+        self.verticalScrollBar().valueChanged.connect(self.updateTimer.start)
+
+    #---NODE / TRACK API---#
+
+    def setNode(self, nodeId, lat, lon, label=None):
+        """Add a node marker, or move an existing one."""
+        item = self.nodes.get(nodeId)
+        if item is None:
+            item = QGraphicsEllipseItem(-5, -5, 10, 10)
+            item.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+            item.setBrush(QBrush(QColor(NODE_COLOR)))
+            item.setPen(QPen(Qt.white, 1))
+            item.setZValue(2)
+            item.label = QGraphicsSimpleTextItem(item)
+            item.label.setPos(8, -8)
+            item.label.setVisible(self.labelsVisible)
+            self.scene.addItem(item)
+            self.nodes[nodeId] = item
+        item.label.setText(label or nodeId)
+        item.setToolTip(label or nodeId)
+        item.setPos(lonLatToWorld(lon, lat))
+        for key in self.nodeLinks.get(nodeId, ()):
+            self.links[key].setLine(QLineF(self.nodes[key[0]].pos(), self.nodes[key[1]].pos()))
+
+    def removeNode(self, nodeId):
+        """Remove a node marker and its track."""
+        item = self.nodes.pop(nodeId, None)
+        if item is not None:
+            self.scene.removeItem(item)
+        for key in list(self.nodeLinks.get(nodeId, ())):
+            self._removeLink(key)
+        self.critical.discard(nodeId)
+        track = self.tracks.pop(nodeId, None)
+        if track is not None:
+            self.scene.removeItem(track)
+
+    def addTrackPoint(self, nodeId, lat, lon):
+        """Extend a node's track with a new position."""
+        point = lonLatToWorld(lon, lat)
+        track = self.tracks.get(nodeId)
+        if track is None:
+            path = QPainterPath(point)
+            track = QGraphicsPathItem(path)
+            pen = QPen(QColor(TRACK_COLOR), 2)
+            pen.setCosmetic(True)
+            track.setPen(pen)
+            track.setZValue(1)
+            self.scene.addItem(track)
+            self.tracks[nodeId] = track
+        else:
+            path = track.path()
+            path.lineTo(point)
+            track.setPath(path)
+
+    def clearTracks(self):
+        """Remove every node track."""
+        for track in self.tracks.values():
+            self.scene.removeItem(track)
+        self.tracks.clear()
+
+    def setLinks(self, links):
+        """Show topology links as (nodeA, nodeB, quality) tuples, replacing the previous set.  Existing lines are reused."""
+        wanted = {(a, b): quality for a, b, quality in links if a in self.nodes and b in self.nodes}
+        for key in [key for key in self.links if key not in wanted]:
+            self._removeLink(key)
+        for key, quality in wanted.items():
+            item = self.links.get(key)
+            if item is None:
+                item = QGraphicsLineItem(QLineF(self.nodes[key[0]].pos(), self.nodes[key[1]].pos()))
+                item.setZValue(1.5)
+                self.scene.addItem(item)
+                self.links[key] = item
+                self.nodeLinks.setdefault(key[0], set()).add(key)
+                self.nodeLinks.setdefault(key[1], set()).add(key)
+            pen = QPen(QColor.fromHsvF(0.33 * quality, 0.9, 0.85), 1.5)
+            pen.setCosmetic(True)
+            item.setPen(pen)
+
+    def _removeLink(self, key):
+        """Remove one topology link line."""
+        self.scene.removeItem(self.links.pop(key))
+        for nodeId in key:
+            self.nodeLinks[nodeId].discard(key)
+
+    def setCriticalNodes(self, nodeIds):
+        """Outline the given nodes (critical relays) and clear the outline from all others."""
+        nodeIds = set(nodeIds)
+        for nodeId in self.critical ^ nodeIds:
+            item = self.nodes.get(nodeId)
+            if item is not None:
+                item.setPen(QPen(QColor(CRITICAL_COLOR), 3) if nodeId in nodeIds else QPen(Qt.white, 1))
+        self.critical = {nodeId for nodeId in nodeIds if nodeId in self.nodes}
+
+    def setOverlay(self, image, west=0.0, south=0.0, east=0.0, north=0.0):
+        """Show a QImage in Web Mercator projection stretched over an area (e.g. the coverage heatmap), or remove it if image is None."""
+        if image is None:
+            if self.overlay is not None:
+                self.scene.removeItem(self.overlay)
+                self.overlay = None
+            return
+        if self.overlay is None:
+            self.overlay = QGraphicsPixmapItem()
+            self.overlay.setZValue(0.5)
+            self.scene.addItem(self.overlay)
+        topLeft, bottomRight = lonLatToWorld(west, north), lonLatToWorld(east, south)
+        self.overlay.setPixmap(QPixmap.fromImage(image))
+        self.overlay.setPos(topLeft)
+        self.overlay.setScale((bottomRight.x() - topLeft.x()) / image.width())
+
+    def visibleBounds(self):
+        """Return the visible area as (west, south, east, north)."""
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        west, north = worldToLonLat(rect.topLeft())
+        east, south = worldToLonLat(rect.bottomRight())
+        return west, south, east, north
+
+    def centerMap(self, lat, lon, zoom=None):
+        """Center the map on a position, optionally changing the zoom level."""
+        if zoom is not None:
+            self.resetTransform()
+            scale = 2.0 ** max(self.minZoom, min(self.maxZoom, zoom))
+            self.scale(scale, scale)
+        self.centerOn(lonLatToWorld(lon, lat))
+        self.updateTimer.start()
+
+    #---TILES---#
+
+    def zoomLevel(self):
+        """Return the tile zoom level matching the current view scale."""
+        return max(self.minZoom, min(self.maxZoom, round(math.log2(self.transform().m11()))))
+
+    def updateTiles(self):
+        """Show the tiles covering the visible area at the current zoom level and drop all others from the scene."""
+        z = self.zoomLevel()
+        n = 2 ** z
+        span = TILE_SIZE / n
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        x0, x1 = max(0, int(rect.left() // span)), min(n - 1, int(rect.right() // span))
+        y0, y1 = max(0, int(rect.top() // span)), min(n - 1, int(rect.bottom() // span))
+        wanted = {(z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)}
+
+        for key in [key for key in self.tileItems if key not in wanted]:
+            self.scene.removeItem(self.tileItems.pop(key))
+        for key in wanted:
+            if key not in self.tileItems:
+                pixmap = self._tile(key)
+                if pixmap is not None:
+                    self._addTileItem(key, pixmap)
+
+        labelsVisible = z >= LABEL_ZOOM
+        if labelsVisible != self.labelsVisible:
+            self.labelsVisible = labelsVisible
+            for item in self.nodes.values():
+                item.label.setVisible(labelsVisible)
+
+    def _tilePath(self, key):
+        """Return the disk cache path of a tile."""
+        z, x, y = key
+        return os.path.join(self.tileDir, str(z), str(x), "%d.png" % y)
+
+    def _tile(self, key):
+        """Return a tile pixmap from memory or disk, requesting a download if it is not cached anywhere."""
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            return pixmap
+        path = self._tilePath(key)
+        if os.path.exists(path):
+            pixmap = QPixmap(path)
+            if not pixmap.isNull():
+                self.pixmaps.put(key, pixmap)
+                return pixmap
+        if self.tileUrl and key not in self.requests:
+            z, x, y = key
+            request = QNetworkRequest(QUrl(self.tileUrl.format(z=z, x=x, y=y)))
+            request.setRawHeader(QByteArray(b"User-Agent"), QByteArray(b"Meshtastic-Desktop"))
+            self.requests.add(key)
+            # Keep the key here rather than in a request attribute, which can come back as an (unhashable) list.
+            self.replies[self.network.get(request)] = key
+        return None
+
+    def _addTileItem(self, key, pixmap):
+        """Place a tile pixmap in the scene."""
+        z, x, y = key
+        span = TILE_SIZE / 2 ** z
+        item = QGraphicsPixmapItem(pixmap)
+        item.setPos(x * span, y * span)
+        item.setScale(span / TILE_SIZE)
+        item.setZValue(0)
+        item.setTransformationMode(Qt.SmoothTransformation)
+        self.scene.addItem(item)
+        self.tileItems[key] = item
+
+    def _onTileDownloaded(self, reply):
+        """Write a downloaded tile to the disk cache and show it if it is still in view."""
+        key = self.replies.pop(reply, None)
+        self.requests.discard(key)
+        data = reply.readAll()
+        reply.deleteLater()
+        if key is None or reply.error() != QNetworkReply.NoError:
+            return
+        pixmap = QPixmap()
+        if not pixmap.loadFromData(data):
+            return
+        path = self._tilePath(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data.data())
+        self.pixmaps.put(key, pixmap)
+        if key[0] == self.zoomLevel() and key not in self.tileItems:
+            self._addTileItem(key, pixmap)
+
+    #---VIEW EVENTS---#
+
+    def wheelEvent(self, event):
+        """Zoom in or out around the mouse pointer."""
+        factor = 2.0 ** (event.angleDelta().y() / 480.0)
+        scale = self.transform().m11() * factor
+        if 2.0 ** self.minZoom <= scale <= 2.0 ** self.maxZoom:
+            self.scale(factor, factor)
+            self.updateTimer.start()
+
+    def resizeEvent(self, event):
+        """Load the tiles uncovered by a resize."""
+        super().resizeEvent(event)
+        self.updateTimer.start()
@@ -0,0 +1,266 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# RF coverage heatmap built from the SNR/RSSI of received position reports
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Requires NumPy (pip3 install numpy).  The coverage overlay is optional; the rest of the program works without it.
+#
+# Observations are binned into a Web Mercator grid of about 150 m cells (at the equator).  The grid is stored sparsely as
+# chunks of CHUNK_CELLS x CHUNK_CELLS cells, one per zoom 12 map tile, each holding per-cell sample counts and SNR/RSSI
+# sums - so adding a sample is a couple of array increments however many samples there are, and memory grows with the
+# area covered rather than the number of samples.  For zoomed out views there is a pyramid of coarser levels, each
+# merging 2 x 2 cells of the level below.  Changes are only propagated up the pyramid when a coarse level is rendered, and
+# only for the chunks that changed, so an update costs one small block reduction per level.  Rendering picks the level whose
+# cells best match the view, places the few chunks in view and colors the cell means through a lookup table.  Run this
+# file directly for a benchmark.
+
+
+import math, sqlite3, time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK_ZOOM = 12
+CHUNK_BITS = 6
+CHUNK_CELLS = 1 << CHUNK_BITS
+GRID_CELLS = 1 << (CHUNK_ZOOM + CHUNK_BITS)     # Cells across the whole world
+MAX_LEVEL = CHUNK_ZOOM                          # At the top level one chunk covers the whole world
+MAX_LATITUDE = 85.0511287798
+BATCH_SIZE = 100000
+
+# Layers of each chunk, and the value range mapped onto the color ramp for each metric.
+COUNT_SNR, SUM_SNR, COUNT_RSSI, SUM_RSSI = range(4)
+METRICS = {
+    "snr": (COUNT_SNR, SUM_SNR, -20.0, 10.0),
+    "rssi": (COUNT_RSSI, SUM_RSSI, -130.0, -50.0),
+}
+
+
+def available():
+    """Return True if NumPy is installed."""
+    return np is not None
+
+
+def _colorTable(alpha=170):
+    """Return a 257 entry RGBA lookup table running from red (weak) through yellow to green (strong), then transparent."""
+    t = np.linspace(0.0, 1.0, 256)
+    table = np.zeros((257, 4), dtype=np.uint8)
+    table[:256, 0] = np.clip(2.0 - 2.0 * t, 0, 1) * 220
+    table[:256, 1] = np.clip(2.0 * t, 0, 1) * 200
+    table[:256, 2] = 40
+    table[:256, 3] = alpha
+    return table
+
+
+def cellOf(lat, lon):
+    """Return the (x, y) grid cell of a position.  Works on scalars or NumPy arrays."""
+    if np is not None and isinstance(lat, np.ndarray):
+        lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+        x = ((lon + 180.0) / 360.0 * GRID_CELLS).astype(np.int64)
+        y = ((1.0 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2.0 * GRID_CELLS).astype(np.int64)
+        return np.clip(x, 0, GRID_CELLS - 1), np.clip(y, 0, GRID_CELLS - 1)
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lon + 180.0) / 360.0 * GRID_CELLS)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * GRID_CELLS)
+    return max(0, min(GRID_CELLS - 1, x)), max(0, min(GRID_CELLS - 1, y))
+
+
+def cellToLonLat(x, y):
+    """Return the (longitude, latitude) of the north-west corner of a grid cell (fractional cells allowed)."""
+    lon = x / GRID_CELLS * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y / GRID_CELLS))))
+    return lon, lat
+
+
+class CoverageGrid:
+    """Sparse grid of SNR/RSSI observations.  Not thread safe; use one grid per thread and merge()."""
+
+    def __init__(self):
+        """Class instantiation."""
+        # Per level: (chunk x, chunk y) -> float32 array of shape (4, CHUNK_CELLS, CHUNK_CELLS).  Level 0 holds the
+        # observations; dirty lists the chunks of each level that changed since they were last merged into the level above.
+        self.levels = [{} for level in range(MAX_LEVEL + 1)]
+        self.dirty = [set() for level in range(MAX_LEVEL + 1)]
+        self.chunks = self.levels[0]
+        self.samples = 0
+        self.version = 0
+        self.colors = _colorTable()
+
+    def _chunk(self, key):
+        """Return a level 0 chunk for updating, creating it if needed and marking the chunks above it out of date."""
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = np.zeros((4, CHUNK_CELLS, CHUNK_CELLS), dtype=np.float32)
+        self.dirty[0].add(key)
+        return chunk
+
+    def _propagate(self, top):
+        """Merge the changed chunks of every level below top into the levels above them."""
+        half = CHUNK_CELLS // 2
+        for level in range(1, top + 1):
+            chunks = self.levels[level]
+            for cx, cy in self.dirty[level - 1]:
+                child = self.levels[level - 1][(cx, cy)]
+                key = (cx >> 1, cy >> 1)
+                chunk = chunks.get(key)
+                if chunk is None:
+                    chunk = chunks[key] = np.zeros((4, CHUNK_CELLS, CHUNK_CELLS), dtype=np.float32)
+                row, column = (cy & 1) * half, (cx & 1) * half
+                chunk[:, row:row + half, column:column + half] = child[:, 0::2, 0::2] + child[:, 1::2, 0::2] + child[:, 0::2, 1::2] + child[:, 1::2, 1::2]
+                self.dirty[level].add(key)
+            self.dirty[level - 1].clear()
+
+    def add(self, lat, lon, snr=None, rssi=None):
+        """Add one observation.  Either of snr and rssi may be None."""
+        if snr is None and rssi is None:
+            return
+        x, y = cellOf(lat, lon)
+        chunk = self._chunk((x >> CHUNK_BITS, y >> CHUNK_BITS))
+        row, column = y & (CHUNK_CELLS - 1), x & (CHUNK_CELLS - 1)
+        if snr is not None:
+            chunk[COUNT_SNR, row, column] += 1
+            chunk[SUM_SNR, row, column] += snr
+        if rssi is not None:
+            chunk[COUNT_RSSI, row, column] += 1
+            chunk[SUM_RSSI, row, column] += rssi
+        self.samples += 1
+        self.version += 1
+
+    def addMany(self, lat, lon, snr, rssi):
+        """Add many observations at once from equal length sequences.  Missing snr/rssi values are None or NaN."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        snr = np.asarray(snr, dtype=np.float64)
+        rssi = np.asarray(rssi, dtype=np.float64)
+        valid = ~(np.isnan(lat) | np.isnan(lon) | (np.isnan(snr) & np.isnan(rssi)))
+        if not valid.any():
+            return
+        lat, lon, snr, rssi = lat[valid], lon[valid], snr[valid], rssi[valid]
+        x, y = cellOf(lat, lon)
+        keys = (x >> CHUNK_BITS) * (GRID_CELLS >> CHUNK_BITS) + (y >> CHUNK_BITS)
+        cells = (y & (CHUNK_CELLS - 1)) * CHUNK_CELLS + (x & (CHUNK_CELLS - 1))
+        # Sort by chunk so each chunk's samples are one contiguous slice, then bin each slice with bincount.
+        order = np.argsort(keys, kind="stable")
+        keys, cells, snr, rssi = keys[order], cells[order], snr[order], rssi[order]
+        uniqueKeys, starts = np.unique(keys, return_index=True)
+        ends = np.append(starts[1:], len(keys))
+        size = CHUNK_CELLS * CHUNK_CELLS
+        for key, start, end in zip(uniqueKeys.tolist(), starts.tolist(), ends.tolist()):
+            chunk = self._chunk(divmod(key, GRID_CELLS >> CHUNK_BITS)).reshape(4, size)
+            for count, total, values in ((COUNT_SNR, SUM_SNR, snr[start:end]), (COUNT_RSSI, SUM_RSSI, rssi[start:end])):
+                present = ~np.isnan(values)
+                chunk[count] += np.bincount(cells[start:end][present], minlength=size)
+                chunk[total] += np.bincount(cells[start:end][present], weights=values[present], minlength=size)
+        self.samples += len(keys)
+        self.version += 1
+
+    def merge(self, other):
+        """Add every observation of another grid to this one."""
+        for key, chunk in other.chunks.items():
+            self._chunk(key)[:] += chunk
+        self.samples += other.samples
+        self.version += 1
+
+    def load(self, dbPath):
+        """Add the SNR/RSSI of every stored position (storage.MessageStore's positions table), BATCH_SIZE rows at a time.
+
+        The history does not record whether a position was heard directly or through a relay, so relayed reports (whose
+        SNR is that of the last hop) are included.
+        """
+        db = sqlite3.connect(dbPath)
+        try:
+            cursor = db.execute("SELECT latitude, longitude, snr, rssi FROM positions WHERE snr IS NOT NULL OR rssi IS NOT NULL")
+            while True:
+                rows = cursor.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                # None becomes NaN in a float array.
+                lat, lon, snr, rssi = np.array(rows, dtype=np.float64).T
+                self.addMany(lat, lon, snr, rssi)
+        finally:
+            db.close()
+
+    def render(self, west, south, east, north, metric="snr", maxSize=512):
+        """Render the mean of a metric over an area as an RGBA image.
+
+        Returns (image, (west, south, east, north)) where image is a uint8 array of shape (height, width, 4) in Web
+        Mercator projection and the bounds are snapped to the rendered cells, or None if there is no data in the area.
+        Cells without samples are transparent.  The image is at most about maxSize pixels across: when the area spans
+        more cells, a coarser level of the pyramid is used.
+        """
+        count, total, low, high = METRICS[metric]
+        x0, y0 = cellOf(north, west)
+        x1, y1 = cellOf(south, east)
+        level = 0
+        while level < MAX_LEVEL and max(x1 - x0, y1 - y0) >> level >= maxSize:
+            level += 1
+        x0, y0, x1, y1 = x0 >> level, y0 >> level, x1 >> level, y1 >> level
+        width, height = x1 - x0 + 1, y1 - y0 + 1
+        self._propagate(level)
+
+        chunks = self.levels[level]
+        counts = np.zeros((height, width), dtype=np.float32)
+        sums = np.zeros((height, width), dtype=np.float32)
+        found = False
+        for cx in range((x0 >> CHUNK_BITS), (x1 >> CHUNK_BITS) + 1):
+            for cy in range((y0 >> CHUNK_BITS), (y1 >> CHUNK_BITS) + 1):
+                chunk = chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                found = True
+                # Position of the chunk in the image, clipped to the image where the chunk only partly overlaps it.
+                px, py = (cx << CHUNK_BITS) - x0, (cy << CHUNK_BITS) - y0
+                left, top = max(0, -px), max(0, -py)
+                right, bottom = min(CHUNK_CELLS, width - px), min(CHUNK_CELLS, height - py)
+                counts[py + top:py + bottom, px + left:px + right] = chunk[count, top:bottom, left:right]
+                sums[py + top:py + bottom, px + left:px + right] = chunk[total, top:bottom, left:right]
+        if not found:
+            return None
+
+        empty = counts == 0
+        np.maximum(counts, 1, out=counts)
+        np.divide(sums, counts, out=sums)
+        np.subtract(sums, low, out=sums)
+        np.multiply(sums, 255.0 / (high - low), out=sums)
+        np.clip(sums, 0, 255, out=sums)
+        index = sums.astype(np.intp)
+        index[empty] = 256
+        image = self.colors.take(index, axis=0)
+        westEdge, northEdge = cellToLonLat(x0 << level, y0 << level)
+        eastEdge, southEdge = cellToLonLat((x1 + 1) << level, (y1 + 1) << level)
+        return image, (westEdge, southEdge, eastEdge, northEdge)
+
+if __name__ == '__main__':
+    # Benchmark: a few million samples scattered around a handful of sites, then single updates and re-renders of a
+    # typical map view.
+    rng = np.random.default_rng(1)
+    grid = CoverageGrid()
+    total = 4000000
+    sites = rng.uniform([32.0, -107.0], [34.0, -104.0], size=(20, 2))
+    site = rng.integers(0, len(sites), total)
+    lat = sites[site, 0] + rng.normal(0, 0.08, total)
+    lon = sites[site, 1] + rng.normal(0, 0.1, total)
+    snr = rng.normal(-2, 6, total)
+    rssi = rng.normal(-95, 12, total)
+    snr[rng.random(total) < 0.1] = np.nan
+
+    start = time.perf_counter()
+    for i in range(0, total, BATCH_SIZE):
+        grid.addMany(lat[i:i + BATCH_SIZE], lon[i:i + BATCH_SIZE], snr[i:i + BATCH_SIZE], rssi[i:i + BATCH_SIZE])
+    elapsed = time.perf_counter() - start
+    print("bulk load:   %d samples in %.2f s (%.0f samples/s), %d chunks, %.1f MB" % (total, elapsed, total / elapsed, len(grid.chunks), len(grid.chunks) * 4 * CHUNK_CELLS ** 2 * 4 / 1e6))
+
+    views = {"city (z14)": (-105.95, 32.85, -105.65, 33.05), "region (z10)": (-107.5, 31.5, -103.5, 34.5),
+             "state (z7)": (-110.0, 30.0, -100.0, 37.0), "world (z2)": (-180.0, -80.0, 180.0, 80.0)}
+    for name, bounds in views.items():
+        timings = []
+        for i in range(200):
+            start = time.perf_counter()
+            grid.add(float(rng.uniform(32.9, 33.0)), float(rng.uniform(-105.9, -105.7)), float(rng.normal(-2, 6)), float(rng.normal(-95, 12)))
+            image, _ = grid.render(*bounds)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print("add + render %-13s %4dx%-4d image, median %.2f ms / p95 %.2f ms" % (name + ":", image.shape[1], image.shape[0], timings[100] * 1000, timings[190] * 1000))
@@ -0,0 +1,217 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Segmentation and reassembly of text messages longer than one Meshtastic packet
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# A message that fits in one packet is sent unchanged.  A longer one is split into segments that each start with a short
+# readable header, "(id n/N) ", where id is two base-36 characters identifying the message and n/N are single base-36
+# digits (so at most 35 segments, about 6.5 kB of text).  Clients that don't reassemble still show readable numbered
+# parts.  So that an ordinary message which happens to start with something like "(ab 1/2) " is not mistaken for a
+# segment, the header is preceded by an invisible word joiner (U+2060), and every segment but the last is nearly a full
+# packet.  Run this file directly to measure header overhead and reassembly latency over a simulated lossy link.
+
+
+import queue, random, re, string, threading, time
+
+from collections import OrderedDict
+
+MAX_PAYLOAD = 200           # Bytes of UTF-8 text that reliably fit in one Meshtastic text packet
+MAX_SEGMENTS = 35
+DIGITS = string.digits + string.ascii_lowercase
+MARKER = "\u2060"            # Word joiner - zero width, and not something people start a message with
+HEADER = re.compile(r"^\u2060\(([0-9a-z]{2}) ([1-9a-z])/([1-9a-z])\) ")
+HEADER_LENGTH = len((MARKER + "(id n/N) ").encode("utf-8"))
+MISSING = " [...] "
+
+
+def _utf8Cut(data, limit):
+    """Return the largest cut point <= limit that does not fall inside a UTF-8 character, preferring whitespace."""
+    if len(data) <= limit:
+        return len(data)
+    cut = limit
+    while cut > 0 and data[cut] & 0xC0 == 0x80:
+        cut -= 1
+    # Break after a space if there is one in the last fifth of the segment, so words are not split across bubbles.
+    space = data.rfind(b" ", cut - limit // 5, cut)
+    return space + 1 if space > 0 else cut
+
+
+def split(text, maxPayload=MAX_PAYLOAD, messageId=None):
+    """Split text into the list of packet payloads to send.  Raises ValueError if it needs more than MAX_SEGMENTS."""
+    data = text.encode("utf-8")
+    if len(data) <= maxPayload:
+        return [text]
+    budget = maxPayload - HEADER_LENGTH
+    parts = []
+    while data:
+        cut = _utf8Cut(data, budget)
+        parts.append(data[:cut])
+        data = data[cut:]
+    if len(parts) > MAX_SEGMENTS:
+        raise ValueError("Message is too long to send (%d segments, maximum %d)." % (len(parts), MAX_SEGMENTS))
+    if messageId is None:
+        messageId = random.choice(DIGITS) + random.choice(DIGITS)
+    total = DIGITS[len(parts)]
+    return [MARKER + "(%s %s/%s) " % (messageId, DIGITS[i + 1], total) + part.decode("utf-8") for i, part in enumerate(parts)]
+
+
+def minimumSegment(maxPayload=MAX_PAYLOAD):
+    """Return the fewest UTF-8 bytes split() puts in any segment but the last, header included."""
+    budget = maxPayload - HEADER_LENGTH
+    # _utf8Cut() backs off at most 3 bytes to a character boundary, or to a space within the last fifth of the budget.
+    return HEADER_LENGTH + min(budget - 3, budget - budget // 5 - 2)
+
+
+class Reassembler:
+    """Collects segments, which may arrive out of order or more than once, and returns whole messages.
+
+    Memory is bounded: partial messages older than timeout seconds are expired, and if more than maxMessages are
+    pending or their text exceeds maxBytes the oldest are expired early.  Completed messages are remembered for timeout
+    seconds (at most maxCompleted of them) so late duplicates of their segments are ignored.
+    """
+
+    def __init__(self, timeout=300.0, maxMessages=64, maxBytes=65536, maxPayload=MAX_PAYLOAD, maxCompleted=256):
+        """Class instantiation.  maxPayload is the packet size the sender split messages for."""
+        self.timeout = timeout
+        self.minSegment = minimumSegment(maxPayload)
+        self.maxMessages = maxMessages
+        self.maxBytes = maxBytes
+        self.maxCompleted = maxCompleted
+        self.pending = OrderedDict()        # (sender, id) -> [first seen, total, {index: text}, context]
+        self.completed = OrderedDict()      # (sender, id) -> (time completed, total), oldest first
+        self.bytes = 0
+        self.expired = []
+
+    def add(self, sender, text, now=None, context=None):
+        """Add a received text.  Returns the complete message text, or None if more segments are still needed.
+
+        Texts without a segment header are returned unchanged.  context (e.g. the first packet) is kept with a partial
+        message and handed back by expire().
+        """
+        match = HEADER.match(text)
+        if match is None:
+            return text
+        now = time.monotonic() if now is None else now
+        messageId, index, total = match.group(1), DIGITS.index(match.group(2)), DIGITS.index(match.group(3))
+        # A real segment never claims to be part 1 of 1, and only the last one may be short.
+        if total < 2 or index > total or (index < total and len(text.encode("utf-8")) < self.minSegment):
+            return text
+        key = (sender, messageId)
+        done = self.completed.get(key)
+        if done is not None and done[1] == total and now - done[0] < self.timeout:
+            return None
+        entry = self.pending.get(key)
+        if entry is None or entry[1] != total:
+            if entry is not None:
+                self._drop(key)
+            entry = self.pending[key] = [now, total, {}, context]
+        body = text[match.end():]
+        if index not in entry[2]:
+            entry[2][index] = body
+            self.bytes += len(body)
+        if len(entry[2]) == total:
+            self._drop(key)
+            self.completed.pop(key, None)
+            self.completed[key] = (now, total)
+            if len(self.completed) > self.maxCompleted:
+                self.completed.popitem(last=False)
+            return "".join(entry[2][i] for i in range(1, total + 1))
+        self._enforceLimits(now)
+        return None
+
+    def _drop(self, key):
+        """Forget a pending message."""
+        entry = self.pending.pop(key)
+        self.bytes -= sum(len(body) for body in entry[2].values())
+        return entry
+
+    def _enforceLimits(self, now):
+        """Expire partial messages that are too old, or the oldest ones while over the memory limits."""
+        while self.completed and now - next(iter(self.completed.values()))[0] >= self.timeout:
+            self.completed.popitem(last=False)
+        while self.pending:
+            key, entry = next(iter(self.pending.items()))
+            if now - entry[0] < self.timeout and len(self.pending) <= self.maxMessages and self.bytes <= self.maxBytes:
+                break
+            self._drop(key)
+            parts = entry[2]
+            self.expired.append((entry[3], MISSING.join(parts.get(i, "").strip() for i in range(1, entry[1] + 1))))
+
+    def expire(self, now=None):
+        """Expire timed-out partial messages and return them as (context, text with gaps marked) pairs."""
+        self._enforceLimits(time.monotonic() if now is None else now)
+        expired, self.expired = self.expired, []
+        return expired
+
+
+class SendQueue:
+    """Sends queued messages from a background thread, one whole message (all of its segments) at a time.
+
+    Segments of one message are never interleaved with another message's, and are paced so a long paste does not
+    flood the mesh.
+    """
+
+    def __init__(self, send, pacing=0.5):
+        """Class instantiation.  send(payload, destinationId, channelIndex) transmits one packet."""
+        self.send = send
+        self.pacing = pacing
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="send", daemon=True)
+        self.thread.start()
+
+    def put(self, payloads, destinationId, channelIndex):
+        """Queue the payloads of one message for sending."""
+        self.queue.put((payloads, destinationId, channelIndex))
+
+    def _run(self):
+        """Sender thread loop."""
+        while True:
+            payloads, destinationId, channelIndex = self.queue.get()
+            for i, payload in enumerate(payloads):
+                if i:
+                    time.sleep(self.pacing)
+                try:
+                    self.send(payload, destinationId, channelIndex)
+                except Exception:
+                    # The radio went away mid-message; the remaining segments could not be delivered either.
+                    break
+
+
+if __name__ == '__main__':
+    # Simulated lossy link: each segment is lost with probability LOSS per attempt, retried up to RETRIES times (as
+    # Meshtastic does for acknowledged packets), and delayed by a random airtime, so segments arrive out of order.
+    random.seed(1)
+    LOSS, RETRIES, PACING, AIRTIME, RETRY_DELAY = 0.2, 3, 0.5, (0.3, 2.0), 5.0
+    words = ["alpha", "bravo", "charlie", "delta", "échelon", "fußweg", "кордон", "河流", "🛰️", "trail", "ridge", "camp"]
+
+    for length in (150, 400, 1000, 3000):
+        payloadBytes = overheadBytes = complete = 0
+        latencies = []
+        for trial in range(500):
+            text = ""
+            while len(text.encode("utf-8")) < length:
+                text += random.choice(words) + " "
+            payloads = split(text)
+            payloadBytes += sum(len(p.encode("utf-8")) for p in payloads)
+            overheadBytes += sum(len(p.encode("utf-8")) for p in payloads) - len(text.encode("utf-8"))
+            arrivals = []
+            for i, payload in enumerate(payloads):
+                sent = i * PACING
+                for attempt in range(RETRIES + 1):
+                    if random.random() >= LOSS:
+                        arrivals.append((sent + attempt * RETRY_DELAY + random.uniform(*AIRTIME), payload))
+                        break
+            arrivals.sort()
+            reassembler = Reassembler()
+            for arrival, payload in arrivals:
+                result = reassembler.add("!00000001", payload, now=arrival)
+                if result is not None:
+                    assert result == text
+                    complete += 1
+                    latencies.append(arrival)
+                    break
+        latencies.sort()
+        print("%5d bytes: %4.1f segments, %4.1f%% header overhead, %5.1f%% delivered, latency median %.1f s / p95 %.1f s"
+              % (length, len(split(text)), 100.0 * overheadBytes / payloadBytes, 100.0 * complete / 500,
+                 latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]))
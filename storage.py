@@ -0,0 +1,172 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Persistent message, position and telemetry history with per-channel and per-conversation message views
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os, sqlite3, time
+
+from collections import namedtuple
+
+# Bubble color keys.  Received messages are colored by channel index, sent messages share one color.
+SENT = -1
+CH0, CH1, CH2, CH3, CH4, CH5, CH6, CH7 = range(8)
+
+BROADCAST_ID = "^all"
+
+Message = namedtuple("Message", ["id", "time", "sent", "channel", "sender", "peer", "text", "snr", "rssi"])
+
+
+def channelView(channel):
+    """Return the view key for a channel."""
+    return "ch:%d" % channel
+
+
+def peerView(peer):
+    """Return the view key for a direct-message conversation with a node."""
+    return "dm:" + peer
+
+
+def messageView(message):
+    """Return the view key a message belongs to.  Direct messages go to the peer's conversation, the rest to their channel."""
+    if message.peer is not None:
+        return peerView(message.peer)
+    return channelView(message.channel)
+
+
+class MessageStore:
+    """Message history stored in SQLite and mirrored in memory.
+
+    Every message is appended to one in-memory log.  Each view (channel or direct-message peer) keeps a list of log
+    positions which is appended to on insert, so switching views hands back an existing list instead of rescanning the
+    history.  Unread counts are maintained the same way.
+
+    Node positions and telemetry are written to the same database but not kept in memory; they are read back by
+    streaming queries (see export.py).
+    """
+
+    def __init__(self, path):
+        """Class instantiation.  Opens (or creates) the history database at the given path and loads it."""
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        # WAL lets export workers read the database on their own connections while new packets are being written.
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS messages (
+                               id INTEGER PRIMARY KEY,
+                               time REAL NOT NULL,
+                               sent INTEGER NOT NULL,
+                               channel INTEGER NOT NULL,
+                               sender TEXT,
+                               peer TEXT,
+                               text TEXT NOT NULL,
+                               snr REAL,
+                               rssi INTEGER)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS positions (
+                               id INTEGER PRIMARY KEY,
+                               time REAL NOT NULL,
+                               node TEXT NOT NULL,
+                               latitude REAL NOT NULL,
+                               longitude REAL NOT NULL,
+                               altitude REAL,
+                               snr REAL,
+                               rssi INTEGER)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS positions_node_time ON positions (node, time)")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS telemetry (
+                               id INTEGER PRIMARY KEY,
+                               time REAL NOT NULL,
+                               node TEXT NOT NULL,
+                               battery_level REAL,
+                               voltage REAL,
+                               channel_utilization REAL,
+                               air_util_tx REAL,
+                               temperature REAL,
+                               relative_humidity REAL,
+                               barometric_pressure REAL)""")
+        self.db.commit()
+
+        self.messages = []
+        self.views = {channelView(channel): [] for channel in range(8)}
+        self.unread = {}
+        self.activeView = channelView(CH0)
+        for row in self.db.execute("SELECT id, time, sent, channel, sender, peer, text, snr, rssi FROM messages ORDER BY id"):
+            self._index(Message(row[0], row[1], bool(row[2]), *row[3:]))
+
+    def _index(self, message):
+        """Append a message to the log and to its view, returning the view key."""
+        view = messageView(message)
+        self.views.setdefault(view, []).append(len(self.messages))
+        self.messages.append(message)
+        return view
+
+    def add(self, text, channel=CH0, sent=False, sender=None, peer=None, snr=None, rssi=None, timestamp=None):
+        """Store a new message.  Returns the message and the key of the view it was added to."""
+        timestamp = time.time() if timestamp is None else timestamp
+        cursor = self.db.execute("INSERT INTO messages (time, sent, channel, sender, peer, text, snr, rssi) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (timestamp, int(sent), channel, sender, peer, text, snr, rssi))
+        self.db.commit()
+        message = Message(cursor.lastrowid, timestamp, sent, channel, sender, peer, text, snr, rssi)
+        view = self._index(message)
+        if view != self.activeView and not sent:
+            self.unread[view] = self.unread.get(view, 0) + 1
+        return message, view
+
+    def addPacket(self, packet, myId=None):
+        """Store a received text packet (as delivered by meshtastic.receive.text)."""
+        sender = packet.get("fromId") or "!%08x" % packet.get("from", 0)
+        direct = packet.get("toId") not in (None, BROADCAST_ID) and packet.get("toId") == myId
+        return self.add(packet.get("decoded", {}).get("text", ""),
+                        channel=packet.get("channel", CH0),
+                        sender=sender,
+                        peer=sender if direct else None,
+                        snr=packet.get("rxSnr"),
+                        rssi=packet.get("rxRssi"),
+                        timestamp=packet.get("rxTime"))
+
+    def addPosition(self, packet):
+        """Store a received position packet (as delivered by meshtastic.receive.position).  Returns False if it has no fix."""
+        position = packet.get("decoded", {}).get("position", {})
+        if position.get("latitude") is None or position.get("longitude") is None:
+            return False
+        self.db.execute("INSERT INTO positions (time, node, latitude, longitude, altitude, snr, rssi) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (packet.get("rxTime") or time.time(), packet.get("fromId") or "!%08x" % packet.get("from", 0),
+                         position["latitude"], position["longitude"], position.get("altitude"), packet.get("rxSnr"), packet.get("rxRssi")))
+        self.db.commit()
+        return True
+
+    def addTelemetry(self, packet):
+        """Store the device and environment metrics of a received telemetry packet."""
+        telemetry = packet.get("decoded", {}).get("telemetry", {})
+        device = telemetry.get("deviceMetrics", {})
+        environment = telemetry.get("environmentMetrics", {})
+        if not device and not environment:
+            return False
+        self.db.execute("""INSERT INTO telemetry (time, node, battery_level, voltage, channel_utilization, air_util_tx,
+                                                  temperature, relative_humidity, barometric_pressure)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (packet.get("rxTime") or time.time(), packet.get("fromId") or "!%08x" % packet.get("from", 0),
+                         device.get("batteryLevel"), device.get("voltage"), device.get("channelUtilization"), device.get("airUtilTx"),
+                         environment.get("temperature"), environment.get("relativeHumidity"), environment.get("barometricPressure")))
+        self.db.commit()
+        return True
+
+    def activate(self, view):
+        """Make a view the active one, clearing its unread count.  Returns the view's list of log positions."""
+        self.activeView = view
+        self.unread.pop(view, None)
+        return self.views.setdefault(view, [])
+
+    def unreadCount(self, view):
+        """Return the number of unread messages in a view."""
+        return self.unread.get(view, 0)
+
+    def message(self, position):
+        """Return the message at a log position."""
+        return self.messages[position]
+
+    def close(self):
+        """Close the history database."""
+        self.db.close()
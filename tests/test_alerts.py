@@ -0,0 +1,37 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Tests for alerts.py - run with python3 -m pytest tests
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import alerts
+
+
+def matches(pattern, text, **options):
+    ruleset = alerts.RuleSet([dict({"kind": "keyword", "pattern": pattern}, **options)])
+    return bool(ruleset.evaluate({"fromId": "!00000001", "decoded": {"text": text}}, now=0.0))
+
+
+def test_keywords_match_whole_words():
+    assert matches("KE7", "this is ke7, over")
+    assert matches("KE7", "KE7")
+    assert not matches("KE7", "KE7KUS here")
+    assert not matches("KE7", "AKE7 here")
+    assert matches("mayday", "MAYDAY! MAYDAY!")
+
+
+def test_keyword_boundaries_only_apply_to_word_characters():
+    assert matches("#sos", "x#sos")
+    assert not matches("#sos", "#sosa")
+
+
+def test_keywords_can_match_anywhere():
+    assert matches("KE7", "KE7KUS here", word=False)
+
+
+def test_overlapping_keywords_are_checked_separately():
+    ruleset = alerts.RuleSet([{"kind": "keyword", "pattern": "KE7"}, {"kind": "keyword", "pattern": "KE7KUS"}])
+    alertsRaised = ruleset.evaluate({"fromId": "!00000001", "decoded": {"text": "KE7KUS here"}}, now=0.0)
+    assert [alert.rule["pattern"] for alert in alertsRaised] == ["KE7KUS"]
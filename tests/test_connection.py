@@ -0,0 +1,48 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Tests for connection.py - run with python3 -m pytest tests
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import connection
+
+
+def test_backoff_grows_and_stays_capped():
+    assert 0.5 <= connection.backoffDelay(0) <= 1.0
+    assert 4.0 <= connection.backoffDelay(3) <= 8.0
+    for attempt in (10, 1023, 1024, 10 ** 6):
+        assert 30.0 <= connection.backoffDelay(attempt) <= 60.0
+
+
+def fakeProbes(monkeypatch, delays):
+    """Make probe() answer after delays[target] seconds, or not at all for targets that are missing."""
+    def probe(target, timeout):
+        if target not in delays:
+            time.sleep(timeout)
+            return False
+        time.sleep(delays[target])
+        return True
+    monkeypatch.setattr(connection, "probe", probe)
+
+
+def test_discover_prefers_the_last_good_device(monkeypatch):
+    fakeProbes(monkeypatch, {"serial:a": 0.0, "serial:b": 0.2})
+    assert connection.discover(["serial:a", "serial:b"], lastGood="serial:b", timeout=1.0) == "serial:b"
+
+
+def test_discover_falls_back_when_the_last_good_device_is_gone(monkeypatch):
+    fakeProbes(monkeypatch, {"serial:a": 0.1, "serial:c": 0.0})
+    started = time.monotonic()
+    assert connection.discover(["serial:a", "serial:b", "serial:c"], lastGood="serial:b", timeout=0.3) == "serial:c"
+    assert time.monotonic() - started < 0.6
+    fakeProbes(monkeypatch, {})
+    assert connection.discover(["serial:a", "serial:b"], timeout=0.1) is None
+
+
+def test_discover_takes_the_first_answer_without_a_last_good_device(monkeypatch):
+    fakeProbes(monkeypatch, {"serial:a": 0.3, "tcp:b": 0.0})
+    started = time.monotonic()
+    assert connection.discover(["serial:a", "tcp:b"], timeout=1.0) == "tcp:b"
+    assert time.monotonic() - started < 0.2
@@ -0,0 +1,108 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Tests for export.py - run with python3 -m pytest tests
+
+import bz2, csv, gzip, io, json, os, sys
+
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import export, storage
+
+GPX = "{http://www.topografix.com/GPX/1/1}"
+
+# node -> [(time, latitude, longitude, altitude)].  !0000000b has a single fix and !0000000c a fix without altitude.
+TRACKS = {
+    "!0000000a": [(1000, 1.0, 2.0, 10), (1060, 1.5, 2.5, 20), (1120, 2.0, 3.0, 30)],
+    "!0000000b": [(1030, 5.0, 6.0, None)],
+    "!0000000c": [(1010, 7.0, 8.0, 100), (1070, 7.5, 8.5, None)],
+}
+
+
+@pytest.fixture
+def dbPath(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = storage.MessageStore(path)
+    store.add("hello, \"world\"", sender="!0000000a", timestamp=1000)
+    store.add("second line\nof text", sent=True, timestamp=1001)
+    for node, points in TRACKS.items():
+        for time, latitude, longitude, altitude in points:
+            position = {"latitude": latitude, "longitude": longitude}
+            if altitude is not None:
+                position["altitude"] = altitude
+            store.addPosition({"fromId": node, "rxTime": time, "decoded": {"position": position}})
+    store.addTelemetry({"fromId": "!0000000a", "rxTime": 1000, "decoded": {"telemetry": {"deviceMetrics": {"batteryLevel": 87, "voltage": 4.1}}}})
+    store.close()
+    return path
+
+
+def readBack(path, compression):
+    """Return the text of an exported file."""
+    opener = {None: open, "gz": gzip.open, "bz2": bz2.open}[compression]
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz", ".BZ2"])
+def test_csv_round_trip(dbPath, tmp_path, suffix):
+    path = str(tmp_path / ("messages.csv" + suffix))
+    name, compression = export.splitCompression(path)
+    assert export.export(dbPath, "messages", "csv", path, compression=compression) == 2
+    rows = list(csv.DictReader(io.StringIO(readBack(path, compression))))
+    assert [(row["time"], row["sent"], row["sender"], row["text"]) for row in rows] == [
+        ("1970-01-01T00:16:40Z", "0", "!0000000a", "hello, \"world\""),
+        ("1970-01-01T00:16:41Z", "1", "", "second line\nof text"),
+    ]
+    with open(path, "rb") as f:
+        assert f.read(3).startswith({None: b"tim", "gz": b"\x1f\x8b", "bz2": b"BZh"}[compression])
+
+
+def test_telemetry_csv(dbPath, tmp_path):
+    path = str(tmp_path / "telemetry.csv")
+    export.export(dbPath, "telemetry", "csv", path)
+    [row] = csv.DictReader(io.StringIO(readBack(path, None)))
+    assert (row["node"], float(row["battery_level"]), float(row["voltage"])) == ("!0000000a", 87, 4.1)
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_geojson_round_trip(dbPath, tmp_path, suffix):
+    path = str(tmp_path / ("tracks.geojson" + suffix))
+    compression = export.splitCompression(path)[1]
+    assert export.export(dbPath, "tracks", "geojson", path, compression=compression) == 6
+    collection = json.loads(readBack(path, compression))
+    features = {feature["properties"]["node"]: feature for feature in collection["features"]}
+    assert set(features) == set(TRACKS)
+
+    a = features["!0000000a"]
+    assert a["geometry"] == {"type": "LineString", "coordinates": [[2.0, 1.0, 10], [2.5, 1.5, 20], [3.0, 2.0, 30]]}
+    assert a["properties"] == {"node": "!0000000a", "start": "1970-01-01T00:16:40Z", "end": "1970-01-01T00:18:40Z", "points": 3}
+    # A single fix is a Point - a LineString needs at least two positions.
+    assert features["!0000000b"]["geometry"] == {"type": "Point", "coordinates": [6.0, 5.0]}
+    # A track with any fix missing its altitude is written in 2D throughout.
+    assert features["!0000000c"]["geometry"] == {"type": "LineString", "coordinates": [[8.0, 7.0], [8.5, 7.5]]}
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_gpx_round_trip(dbPath, tmp_path, suffix):
+    path = str(tmp_path / ("tracks.gpx" + suffix))
+    compression = export.splitCompression(path)[1]
+    export.export(dbPath, "tracks", "gpx", path, compression=compression)
+    root = ElementTree.fromstring(readBack(path, compression))
+    tracks = {}
+    for track in root.iter(GPX + "trk"):
+        points = []
+        for point in track.iter(GPX + "trkpt"):
+            elevation = point.find(GPX + "ele")
+            points.append((point.find(GPX + "time").text, float(point.get("lat")), float(point.get("lon")),
+                           None if elevation is None else float(elevation.text)))
+        tracks[track.find(GPX + "name").text] = points
+    assert tracks == {node: [(export.isoTime(time), latitude, longitude, altitude) for time, latitude, longitude, altitude in points]
+                      for node, points in TRACKS.items()}
+
+
+def test_wrong_format_is_rejected(dbPath, tmp_path):
+    with pytest.raises(ValueError):
+        export.export(dbPath, "messages", "gpx", str(tmp_path / "messages.gpx"))
@@ -0,0 +1,148 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Tests for messageview.py - run with python3 -m pytest tests
+
+import os, random, sys
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PySide6.QtWidgets")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize
+from PySide6.QtWidgets import QApplication, QStyledItemDelegate
+
+import messageview
+
+
+class CountingDelegate(QStyledItemDelegate):
+    """Gives rows varying heights and records which rows the view asked to measure, and which were off screen then."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.offscreen = set()
+
+    def sizeHint(self, option, index):
+        row = index.row()
+        self.calls.append(row)
+        view = self.parent()
+        top = view.verticalScrollBar().value()
+        y = view.rows.offset(row)
+        if y >= top + view.viewport().height() or y + view.rows.height(row) <= top:
+            self.offscreen.add(row)
+        return QSize(option.rect.width(), 20 + 15 * (row % 7))
+
+
+class RowModel(QAbstractListModel):
+    def __init__(self, count):
+        super().__init__()
+        self.count = count
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.count
+
+    def data(self, index, role=Qt.DisplayRole):
+        return str(index.row()) if role == Qt.DisplayRole else None
+
+    def append(self):
+        self.beginInsertRows(QModelIndex(), self.count, self.count)
+        self.count += 1
+        self.endInsertRows()
+
+
+@pytest.fixture
+def view():
+    app = QApplication.instance() or QApplication([])
+    model = RowModel(100000)
+    view = messageview.MessageView(estimate=40)
+    delegate = CountingDelegate()
+    delegate.setParent(view)
+    view.setModel(model)
+    view.setItemDelegate(delegate)
+    view.resize(400, 600)
+    view.show()
+    app.processEvents()
+    delegate.calls.clear()
+    yield view, model, delegate, app
+    view.close()
+    view.deleteLater()
+    app.processEvents()
+
+
+def visibleRows(view):
+    """Return the rows that intersect the viewport."""
+    top = view.verticalScrollBar().value()
+    first = view.rows.rowAt(top)
+    last = view.rows.rowAt(top + view.viewport().height() - 1)
+    return set(range(first, last + 1))
+
+
+def test_row_heights_match_brute_force():
+    random.seed(3)
+    rows = messageview.RowHeights(30, 1000)
+    heights = [30] * 1000
+    for _ in range(500):
+        row = random.randrange(len(heights))
+        heights[row] = random.randint(10, 200)
+        rows.setHeight(row, heights[row])
+        if random.random() < 0.1:
+            rows.append()
+            heights.append(30)
+    offsets = [0]
+    for height in heights:
+        offsets.append(offsets[-1] + height)
+    for row in range(0, len(heights) + 1, 7):
+        assert rows.offset(row) == offsets[row]
+    for y in range(0, offsets[-1], 97):
+        row = rows.rowAt(y)
+        assert offsets[row] <= y < offsets[row + 1]
+
+
+def test_scrolling_measures_only_visible_rows(view):
+    view, model, delegate, app = view
+    bar = view.verticalScrollBar()
+    hidden = set()
+
+    def scroll(value):
+        bar.setValue(value)
+        app.processEvents()
+        # A row measured below the bottom edge is fine if the view then scrolled to keep the content in place.
+        hidden.update(delegate.offscreen - visibleRows(view))
+        delegate.offscreen.clear()
+
+    # Jump through the whole list, as dragging the scroll bar does, then page down and back up through a stretch of it.
+    for step in range(200):
+        scroll(bar.maximum() * step // 199)
+    for step in range(50):
+        scroll(bar.maximum() // 2 + step * bar.pageStep())
+    for step in range(100):
+        scroll(bar.value() - bar.singleStep())
+    assert len(delegate.calls) == len(set(delegate.calls)), "a row was measured more than once"
+    assert not hidden, "rows that were not on screen were measured"
+    assert len(delegate.calls) < 5000
+
+
+def test_resize_remeasures_only_visible_rows(view):
+    view, model, delegate, app = view
+    view.verticalScrollBar().setValue(view.verticalScrollBar().maximum() // 3)
+    app.processEvents()
+    delegate.calls.clear()
+    view.resize(300, 600)
+    app.processEvents()
+    assert 0 < len(delegate.calls) <= len(visibleRows(view)) + 2
+
+
+def test_appending_keeps_view_at_bottom(view):
+    view, model, delegate, app = view
+    view.scrollToBottom()
+    app.processEvents()
+    delegate.calls.clear()
+    for _ in range(20):
+        model.append()
+        view.scrollToBottom()
+        app.processEvents()
+    assert view.verticalScrollBar().value() == view.verticalScrollBar().maximum()
+    assert sorted(delegate.calls) == list(range(100000, 100020))
+    assert model.count - 1 in visibleRows(view)
@@ -0,0 +1,174 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Tests for mqttbridge.py - run with python3 -m pytest tests
+
+import json, os, sqlite3, sys, threading, time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import mqttbridge
+
+
+class FakeInfo:
+    """Stand-in for paho's MQTTMessageInfo."""
+
+    def __init__(self, acknowledged):
+        self.acknowledged = acknowledged
+
+    def wait_for_publish(self, timeout=None):
+        if not self.acknowledged:
+            time.sleep(timeout)
+
+    def is_published(self):
+        return self.acknowledged
+
+
+class FakeClient:
+    """Stand-in for paho.mqtt.client.Client that records what reaches the "broker" instead of talking to one."""
+
+    def __init__(self):
+        self.on_connect = None
+        self.on_disconnect = None
+        self.online = False
+        self.acking = True
+        self.published = []
+        self.attempts = 0
+        self.lock = threading.Lock()
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def reconnect_delay_set(self, minDelay, maxDelay):
+        pass
+
+    def connect_async(self, host, port):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.online = False
+
+    def goOnline(self):
+        self.online = True
+        self.on_connect(self, None, {}, 0)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.attempts += 1
+        info = FakeInfo(self.online and self.acking)
+        if info.acknowledged:
+            with self.lock:
+                self.published.append((topic, json.loads(payload), retain))
+        return info
+
+
+def waitFor(condition, timeout=5.0):
+    """Poll condition until it is true, failing the test after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def spooled(path):
+    """Return the (topic, payload) messages in a spool database, oldest first."""
+    if not os.path.exists(path):
+        return []
+    db = sqlite3.connect(path)
+    try:
+        return [(topic, json.loads(payload)) for topic, payload in db.execute("SELECT topic, payload FROM spool ORDER BY id")]
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def spoolPath(tmp_path):
+    return str(tmp_path / "spool.db")
+
+
+@pytest.fixture
+def bridge(client, spoolPath):
+    # A long batch interval means batches are only taken when the test wakes the bridge (or the client connects).
+    bridge = mqttbridge.MqttBridge("broker", prefix="test/", spoolPath=spoolPath, batchInterval=60, client=client, ackTimeout=0.2)
+    yield bridge
+    bridge.stop()
+    bridge.thread.join(5)
+
+
+def packet(number):
+    return {"id": number, "decoded": {"payload": b"\x01\x02", "raw": object()}}
+
+
+def test_packets_are_batched_into_one_array(bridge, client):
+    for number in range(3):
+        bridge.submitPacket(packet(number))
+    client.goOnline()
+    waitFor(lambda: client.published)
+    assert client.published == [("test/packets", [{"id": number, "decoded": {"payload": "AQI="}} for number in range(3)], False)]
+
+
+def test_node_updates_are_coalesced(bridge, client):
+    bridge.submitNode({"num": 1, "user": {"id": "!00000001", "longName": "old"}})
+    bridge.submitNode({"num": 2})
+    bridge.submitNode({"num": 1, "user": {"id": "!00000001", "longName": "new"}})
+    client.goOnline()
+    waitFor(lambda: len(client.published) >= 2)
+    assert sorted(client.published) == [("test/nodes/!00000001", {"num": 1, "user": {"id": "!00000001", "longName": "new"}}, True),
+                                        ("test/nodes/!00000002", {"num": 2}, True)]
+
+
+def test_batches_are_spooled_while_offline(bridge, client, spoolPath):
+    bridge.submitPacket(packet(1))
+    bridge.wake.set()
+    waitFor(lambda: spooled(spoolPath))
+    assert spooled(spoolPath) == [("test/packets", [{"id": 1, "decoded": {"payload": "AQI="}}])]
+    assert client.published == []
+
+
+def test_spool_is_replayed_in_order_before_newer_batches(bridge, client, spoolPath):
+    for number in range(1, 3):
+        bridge.submitPacket(packet(number))
+        bridge.wake.set()
+        waitFor(lambda: len(spooled(spoolPath)) == number)
+    bridge.submitPacket(packet(3))
+    client.goOnline()
+    waitFor(lambda: len(client.published) == 3)
+    assert [batch[0]["id"] for topic, batch, retain in client.published] == [1, 2, 3]
+    waitFor(lambda: not spooled(spoolPath))
+
+
+def test_spool_limit_drops_the_oldest_messages():
+    spool = mqttbridge.Spool(":memory:", maxMessages=3)
+    spool.append([("topic", str(number).encode(), False) for number in range(5)])
+    assert spool.count == 3
+    assert [payload for rowId, topic, payload, retain in spool.head(10)] == [b"2", b"3", b"4"]
+    spool.close()
+
+
+def test_stop_keeps_the_batch_waiting_for_an_acknowledgement(client, spoolPath):
+    # The acknowledgement wait outlasts stop()'s timeout, so the bridge thread is still inside it when stop() returns.
+    bridge = mqttbridge.MqttBridge("broker", prefix="test/", spoolPath=spoolPath, batchInterval=60, client=client, ackTimeout=1.0)
+    client.acking = False
+    client.goOnline()
+    bridge.submitPacket(packet(1))
+    bridge.submitNode({"num": 1})
+    bridge.wake.set()
+    waitFor(lambda: client.attempts)
+    bridge.submitPacket(packet(2))
+    started = time.monotonic()
+    bridge.stop(timeout=0.05)
+    assert time.monotonic() - started < 0.5
+    assert bridge.thread.is_alive()
+    assert [topic for topic, payload in spooled(spoolPath)] == ["test/packets", "test/nodes/!00000001", "test/packets"]
+    bridge.thread.join(5)
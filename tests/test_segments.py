@@ -0,0 +1,104 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Tests for segments.py - run with python3 -m pytest tests
+
+import os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import segments
+
+
+def randomText(rng, length):
+    words = ["alpha", "bravo", "échelon", "fußweg", "кордон", "河流", "🛰️", "x" * 60]
+    text = ""
+    while len(text.encode("utf-8")) < length:
+        text += rng.choice(words) + rng.choice([" ", "", "  "])
+    return text
+
+
+def test_split_segments_reassemble_in_any_order():
+    rng = random.Random(1)
+    for trial in range(200):
+        text = randomText(rng, rng.randint(201, 3000))
+        payloads = segments.split(text)
+        assert all(len(payload.encode("utf-8")) <= segments.MAX_PAYLOAD for payload in payloads)
+        assert all(len(payload.encode("utf-8")) >= segments.minimumSegment() for payload in payloads[:-1])
+        rng.shuffle(payloads)
+        reassembler = segments.Reassembler()
+        results = [reassembler.add("!00000001", payload, now=0.0) for payload in payloads]
+        assert results[:-1] == [None] * (len(payloads) - 1)
+        assert results[-1] == text
+
+
+def test_ordinary_messages_that_look_like_segments_pass_through():
+    reassembler = segments.Reassembler()
+    for text in ["(ab 1/2) see you at camp", "(ab 2/2) bring water", "(ab 1/1) ok"]:
+        assert reassembler.add("!00000001", text, now=0.0) == text
+    # Even with the marker, a short segment that is not the last one is not a real segment.
+    short = segments.MARKER + "(ab 1/2) see you at camp"
+    assert reassembler.add("!00000001", short, now=0.0) == short
+    assert not reassembler.pending
+
+
+def longText(words):
+    return " ".join("word%d" % i for i in range(words))
+
+
+def test_duplicate_segments_are_ignored_during_and_after_reassembly():
+    text = longText(100)
+    payloads = segments.split(text, messageId="ab")
+    reassembler = segments.Reassembler(timeout=300.0)
+    assert reassembler.add("!00000001", payloads[0], now=0.0) is None
+    assert reassembler.add("!00000001", payloads[0], now=1.0) is None
+    for payload in payloads[1:-1]:
+        assert reassembler.add("!00000001", payload, now=2.0) is None
+    assert reassembler.add("!00000001", payloads[-1], now=3.0) == text
+    # Late retries of a completed message must not start a phantom partial message.
+    for payload in payloads:
+        assert reassembler.add("!00000001", payload, now=10.0) is None
+    assert not reassembler.pending
+    assert reassembler.expire(now=1000.0) == []
+    # Once the completed message is forgotten, the same id may be used again.
+    assert reassembler.add("!00000001", payloads[0], now=1000.0) is None
+    assert reassembler.pending
+
+
+def test_completed_messages_are_remembered_within_bounds():
+    reassembler = segments.Reassembler(maxCompleted=3)
+    for number in range(5):
+        payloads = segments.split(longText(60), messageId="a%d" % number)
+        for payload in payloads:
+            reassembler.add("!00000001", payload, now=0.0)
+    assert list(reassembler.completed) == [("!00000001", "a2"), ("!00000001", "a3"), ("!00000001", "a4")]
+
+
+def test_partial_messages_expire_with_gaps_marked():
+    payloads = segments.split(longText(100), messageId="ab")
+    assert len(payloads) > 2
+    reassembler = segments.Reassembler(timeout=300.0)
+    reassembler.add("!00000001", payloads[0], now=0.0, context="first")
+    reassembler.add("!00000001", payloads[-1], now=10.0, context="last")
+    assert reassembler.expire(now=299.0) == []
+    [(context, text)] = reassembler.expire(now=300.0)
+    assert context == "first"
+    first = payloads[0][segments.HEADER.match(payloads[0]).end():].strip()
+    last = payloads[-1][segments.HEADER.match(payloads[-1]).end():].strip()
+    assert text == segments.MISSING.join([first] + [""] * (len(payloads) - 2) + [last])
+    assert not reassembler.pending and reassembler.bytes == 0
+
+
+def test_oldest_partial_messages_are_evicted_over_the_limits():
+    reassembler = segments.Reassembler(maxMessages=2)
+    for number in range(3):
+        reassembler.add("!00000001", segments.split(longText(60), messageId="a%d" % number)[0], now=float(number), context=number)
+    assert [context for context, text in reassembler.expire(now=3.0)] == [0]
+    assert list(reassembler.pending) == [("!00000001", "a1"), ("!00000001", "a2")]
+
+    payloads = [segments.split(longText(60), messageId="b%d" % number)[0] for number in range(3)]
+    size = len(payloads[0]) - segments.HEADER.match(payloads[0]).end()
+    reassembler = segments.Reassembler(maxBytes=2 * size)
+    for number, payload in enumerate(payloads):
+        reassembler.add("!00000001", payload, now=0.0, context=number)
+    assert [context for context, text in reassembler.expire(now=0.0)] == [0]
+    assert reassembler.bytes <= 2 * size
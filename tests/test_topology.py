@@ -0,0 +1,104 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Tests for topology.py - run with python3 -m pytest tests
+
+import os, random, sys
+
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import topology
+
+
+def bfsHops(adjacency, root):
+    hops = {root: 0}
+    queue = deque([root])
+    while queue:
+        u = queue.popleft()
+        for v in adjacency[u]:
+            if v not in hops:
+                hops[v] = hops[u] + 1
+                queue.append(v)
+    return hops
+
+
+def bruteArticulationPoints(adjacency):
+    """A node is an articulation point if its neighbors are not all connected once it is removed."""
+    points = set()
+    for node, neighbors in adjacency.items():
+        if len(neighbors) < 2:
+            continue
+        first = next(iter(neighbors))
+        seen = {node, first}
+        queue = deque([first])
+        while queue:
+            u = queue.popleft()
+            for v in adjacency[u]:
+                if v not in seen:
+                    seen.add(v)
+                    queue.append(v)
+        if not set(neighbors) <= seen:
+            points.add(node)
+    return points
+
+
+def test_incremental_hops_expiry_and_articulation_points_match_brute_force():
+    rng = random.Random(7)
+    for trial in range(300):
+        graph = topology.TopologyGraph(maxAge=100.0)
+        nodes = list(range(1, rng.randint(2, 30)))
+        graph.setRoot(nodes[0])
+        now = 0.0
+        for step in range(rng.randint(1, 120)):
+            now += rng.uniform(0, 10)
+            if rng.random() < 0.1:
+                graph.expire(now)
+            elif rng.random() < 0.3:
+                graph.observePath(rng.sample(nodes, min(len(nodes), rng.randint(2, 5))), now=now)
+            else:
+                a, b = rng.choice(nodes), rng.choice(nodes)
+                graph.observe(a, b, rng.uniform(-20, 10), now)
+            if rng.random() < 0.3:
+                expected = bfsHops(graph.adjacency, graph.root)
+                assert {node: graph.hopCount(node) for node in graph.adjacency} == {node: expected.get(node) for node in graph.adjacency}
+                assert graph.articulationPoints() == bruteArticulationPoints(graph.adjacency)
+        expected = bfsHops(graph.adjacency, graph.root)
+        assert {node: graph.hopCount(node) for node in graph.adjacency} == {node: expected.get(node) for node in graph.adjacency}
+        assert graph.articulationPoints() == bruteArticulationPoints(graph.adjacency)
+
+
+def test_expired_edges_are_dropped():
+    graph = topology.TopologyGraph(maxAge=100.0)
+    graph.setRoot(1)
+    graph.observePath([1, 2, 3], now=0.0)
+    graph.observe(1, 3, now=50.0)
+    assert graph.hopCount(3) == 1
+    assert graph.expire(now=120.0) == 2
+    assert set(graph.neighbors(1)) == {"!00000003"}
+    assert graph.hopCount(2) is None and graph.hopCount(3) == 1
+
+
+def relayed(sender, relayByte, hopsTaken, snr=5.0):
+    return {"from": sender, "hopStart": 3, "hopLimit": 3 - hopsTaken, "relayNode": relayByte, "rxSnr": snr, "decoded": {}}
+
+
+def test_relay_observations():
+    me = "!00000001"
+    graph = topology.TopologyGraph()
+    graph.setRoot(me)
+    # One hop through the only known node ending in 0x22: both the relay's link to us and to the sender are learned.
+    graph.observePacket(relayed(0x00000500, 0x22, 1), me, now=0.0, knownNodes=["!00001122", "!00000500"])
+    assert set(graph.neighbors(me)) == {"!00001122"}
+    assert set(graph.neighbors("!00001122")) == {me, "!00000500"}
+    assert graph.neighbors(me)["!00001122"].snr == 5.0
+    # Several hops: only the relay's link to us is known.
+    graph.observePacket(relayed(0x00000600, 0x22, 2), me, now=0.0)
+    assert graph.neighbors("!00000600") == {}
+    # An ambiguous relay byte, or one matching no known node, teaches nothing.
+    graph.observePacket(relayed(0x00000700, 0x33, 1), me, now=0.0, knownNodes=["!00000133", "!00000233"])
+    graph.observePacket(relayed(0x00000700, 0x44, 1), me, now=0.0)
+    assert graph.neighbors("!00000700") == {}
+    # A directly heard packet is not treated as relayed.
+    graph.observePacket(relayed(0x00000800, 0x00, 0), me, now=0.0)
+    assert set(graph.neighbors("!00000800")) == {me}
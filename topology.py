@@ -0,0 +1,251 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Mesh topology graph built from NeighborInfo, traceroute, relay and direct reception observations
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import itertools, time
+
+from collections import deque
+
+SNR_MIN = -20.0         # SNR (dB) mapped to link quality 0.0 - roughly the LoRa demodulation floor
+SNR_MAX = 10.0          # SNR (dB) mapped to link quality 1.0
+SNR_SMOOTHING = 0.3     # Weight of a new SNR observation in the edge's moving average
+
+
+def nodeId(num):
+    """Return the "!xxxxxxxx" form of a node number.  Node IDs that are already strings are returned unchanged."""
+    return num if isinstance(num, str) else "!%08x" % (num & 0xFFFFFFFF)
+
+
+def _lastByte(node):
+    """Return the low byte of a "!xxxxxxxx" node ID, or None for IDs that are not in that form."""
+    try:
+        return int(node[1:], 16) & 0xFF if node.startswith("!") else None
+    except ValueError:
+        return None
+
+
+class Edge:
+    """A radio link between two nodes."""
+
+    __slots__ = ("snr", "lastSeen")
+
+    def __init__(self, snr, lastSeen):
+        """Class instantiation."""
+        self.snr = snr
+        self.lastSeen = lastSeen
+
+    def quality(self, now, halfLife):
+        """Return the link quality (0.0 - 1.0) from the smoothed SNR, decayed by the age of the last observation."""
+        snr = SNR_MIN / 2 if self.snr is None else self.snr
+        base = max(0.0, min(1.0, (snr - SNR_MIN) / (SNR_MAX - SNR_MIN)))
+        return base * 0.5 ** ((now - self.lastSeen) / halfLife)
+
+
+class TopologyGraph:
+    """Weighted, undirected neighbor graph of the mesh.
+
+    Edges are updated in place as packets arrive.  Hop counts from the local node are relaxed incrementally when an edge
+    is added and only recomputed when an edge on a shortest path expires.  Articulation points (nodes whose loss would
+    split the mesh) are recomputed lazily, at most once per structural change, when they are next asked for.
+    """
+
+    def __init__(self, halfLife=1800.0, maxAge=7200.0):
+        """Class instantiation.  Edge quality halves every halfLife seconds; edges unseen for maxAge seconds are dropped."""
+        self.halfLife = halfLife
+        self.maxAge = maxAge
+        self.adjacency = {}
+        self.root = None
+        self.hops = {}
+        self.hopsDirty = False
+        self.version = 0
+        self.structureVersion = 0
+        self._articulation = set()
+        self._articulationVersion = -1
+
+    #---OBSERVATIONS---#
+
+    def setRoot(self, root):
+        """Set the local node, from which hop counts are measured."""
+        self.root = nodeId(root)
+        self.adjacency.setdefault(self.root, {})
+        self.hopsDirty = True
+        self.version += 1
+
+    def observe(self, a, b, snr=None, now=None):
+        """Record that nodes a and b heard each other, optionally with the SNR of the reception."""
+        a, b = nodeId(a), nodeId(b)
+        if a == b:
+            return
+        now = time.time() if now is None else now
+        edge = self.adjacency.get(a, {}).get(b)
+        if edge is None:
+            edge = Edge(snr, now)
+            self.adjacency.setdefault(a, {})[b] = edge
+            self.adjacency.setdefault(b, {})[a] = edge
+            self.structureVersion += 1
+            self._relax(a, b)
+        else:
+            if snr is not None:
+                edge.snr = snr if edge.snr is None else edge.snr + SNR_SMOOTHING * (snr - edge.snr)
+            edge.lastSeen = now
+        self.version += 1
+
+    def observePath(self, path, snrs=None, now=None):
+        """Record every hop along a route, such as one reported by a traceroute."""
+        for i in range(len(path) - 1):
+            snr = snrs[i] if snrs is not None and i < len(snrs) else None
+            self.observe(path[i], path[i + 1], snr, now)
+
+    def observePacket(self, packet, myId=None, now=None, knownNodes=()):
+        """Update the graph from a received packet (as delivered by meshtastic pubsub).
+
+        knownNodes (node IDs, e.g. the interface's node database) helps identify the relay of a relayed packet, along
+        with the nodes already in the graph.
+        """
+        decoded = packet.get("decoded", {})
+        neighborInfo = decoded.get("neighborinfo")
+        if neighborInfo is not None:
+            reporter = neighborInfo.get("nodeId", packet.get("from"))
+            for neighbor in neighborInfo.get("neighbors", []):
+                self.observe(reporter, neighbor["nodeId"], neighbor.get("snr"), now)
+
+        traceroute = decoded.get("traceroute")
+        if traceroute is not None and "from" in packet and "to" in packet:
+            # A traceroute reply comes from the traced node; "route" lists the relays on the way out, "routeBack" on the way back.
+            forward = [packet["to"]] + traceroute.get("route", []) + [packet["from"]]
+            self.observePath(forward, [snr / 4.0 for snr in traceroute.get("snrTowards", [])] or None, now)
+            if "routeBack" in traceroute or "snrBack" in traceroute:
+                back = [packet["from"]] + traceroute.get("routeBack", []) + [packet["to"]]
+                self.observePath(back, [snr / 4.0 for snr in traceroute.get("snrBack", [])] or None, now)
+
+        # A packet whose hop limit is still at its starting value was heard directly, not through a relay.
+        if myId is not None and "hopStart" in packet and packet.get("hopStart") == packet.get("hopLimit") and "from" in packet:
+            self.observe(myId, packet["from"], packet.get("rxSnr"), now)
+
+        # A relayed packet carries only the low byte of the relay's node number (firmware 2.6 and later; 0 if unknown).
+        # The relay is linked to us only when exactly one known node matches it, and to the sender as well when the
+        # packet took a single hop.
+        relayNode, hopStart, hopLimit = packet.get("relayNode"), packet.get("hopStart"), packet.get("hopLimit")
+        if myId is not None and relayNode and hopStart is not None and hopLimit is not None and hopStart > hopLimit and "from" in packet:
+            sender = nodeId(packet["from"])
+            candidates = {node for node in itertools.chain(self.adjacency, knownNodes)
+                          if _lastByte(node) == relayNode & 0xFF} - {nodeId(myId), sender}
+            if len(candidates) == 1:
+                relay = candidates.pop()
+                self.observe(myId, relay, packet.get("rxSnr"), now)
+                if hopStart - hopLimit == 1:
+                    self.observe(relay, sender, None, now)
+
+    def expire(self, now=None):
+        """Drop edges that have not been observed for maxAge seconds."""
+        now = time.time() if now is None else now
+        stale = [(a, b) for a, neighbors in self.adjacency.items() for b, edge in neighbors.items()
+                 if a < b and now - edge.lastSeen > self.maxAge]
+        for a, b in stale:
+            del self.adjacency[a][b]
+            del self.adjacency[b][a]
+            # Only an edge that lies on a shortest path can change hop counts.
+            if a in self.hops and b in self.hops and abs(self.hops[a] - self.hops[b]) == 1:
+                self.hopsDirty = True
+        if stale:
+            self.structureVersion += 1
+            self.version += 1
+        return len(stale)
+
+    #---ANALYSIS---#
+
+    def _relax(self, a, b):
+        """Propagate shorter hop counts through a newly added edge."""
+        queue = deque()
+        for u, v in ((a, b), (b, a)):
+            if u in self.hops and self.hops[u] + 1 < self.hops.get(v, float("inf")):
+                self.hops[v] = self.hops[u] + 1
+                queue.append(v)
+        while queue:
+            u = queue.popleft()
+            for v in self.adjacency[u]:
+                if self.hops[u] + 1 < self.hops.get(v, float("inf")):
+                    self.hops[v] = self.hops[u] + 1
+                    queue.append(v)
+
+    def hopCount(self, node):
+        """Return the number of hops from the local node, or None if the node is unreachable in the graph."""
+        if self.hopsDirty:
+            self.hops = {}
+            if self.root is not None:
+                self.hops[self.root] = 0
+                queue = deque([self.root])
+                while queue:
+                    u = queue.popleft()
+                    for v in self.adjacency[u]:
+                        if v not in self.hops:
+                            self.hops[v] = self.hops[u] + 1
+                            queue.append(v)
+            self.hopsDirty = False
+        return self.hops.get(nodeId(node))
+
+    def articulationPoints(self):
+        """Return the set of nodes whose loss would split the mesh (critical relays)."""
+        if self._articulationVersion == self.structureVersion:
+            return self._articulation
+        # Iterative Tarjan so a long chain of relays cannot exceed the recursion limit.
+        index, low, points, counter = {}, {}, set(), 0
+        for start in self.adjacency:
+            if start in index:
+                continue
+            index[start] = low[start] = counter
+            counter += 1
+            children = 0
+            stack = [(start, None, iter(self.adjacency[start]))]
+            while stack:
+                u, parent, neighbors = stack[-1]
+                advanced = False
+                for v in neighbors:
+                    if v == parent:
+                        continue
+                    if v in index:
+                        low[u] = min(low[u], index[v])
+                    else:
+                        index[v] = low[v] = counter
+                        counter += 1
+                        if u == start:
+                            children += 1
+                        stack.append((v, u, iter(self.adjacency[v])))
+                        advanced = True
+                        break
+                if advanced:
+                    continue
+                stack.pop()
+                if parent is not None:
+                    low[parent] = min(low[parent], low[u])
+                    if parent != start and low[u] >= index[parent]:
+                        points.add(parent)
+            if children > 1:
+                points.add(start)
+        self._articulation = points
+        self._articulationVersion = self.structureVersion
+        return points
+
+    def neighbors(self, node):
+        """Return the neighbor dictionary (neighbor ID -> Edge) of a node."""
+        return self.adjacency.get(nodeId(node), {})
+
+    def bestSnr(self, node):
+        """Return the best smoothed SNR of a node's links, or None."""
+        snrs = [edge.snr for edge in self.neighbors(node).values() if edge.snr is not None]
+        return max(snrs) if snrs else None
+
+    def links(self, now=None, minQuality=0.0):
+        """Return (a, b, quality) for every edge, each edge once."""
+        now = time.time() if now is None else now
+        result = []
+        for a, neighbors in self.adjacency.items():
+            for b, edge in neighbors.items():
+                if a < b:
+                    quality = edge.quality(now, self.halfLife)
+                    if quality >= minQuality:
+                        result.append((a, b, quality))
+        return result
@@ -0,0 +1,176 @@
+# Meshtastic-Desktop
+# by Kurt Kochendarfer, KE7KUS
+# Folium / QtWebEngine node map
+
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.  This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.  You should have received a copy of the GNU General Public License along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# This module imports QtWebEngine, which starts a Chromium process.  It is only imported when the web map is selected.
+
+
+import folium, json
+
+from PySide6.QtCore import QBuffer, QIODevice, QUrl
+from PySide6.QtWebEngineWidgets import QWebEngineView
+
+# Leaflet helpers injected into the folium page once it has loaded.  %s is replaced with the folium map variable name.
+HELPERS = """
+window.mtMap = %s;
+window.mtNodes = {};
+window.mtTracks = {};
+window.mtSetNode = function(id, lat, lon, label) {
+    var marker = mtNodes[id];
+    if (marker === undefined) {
+        marker = mtNodes[id] = L.marker([lat, lon]).addTo(mtMap);
+    } else {
+        marker.setLatLng([lat, lon]);
+    }
+    marker.bindTooltip(label, {sticky: true});
+};
+window.mtRemoveNode = function(id) {
+    if (mtNodes[id] !== undefined) { mtMap.removeLayer(mtNodes[id]); delete mtNodes[id]; }
+    if (mtTracks[id] !== undefined) { mtMap.removeLayer(mtTracks[id]); delete mtTracks[id]; }
+};
+window.mtAddTrackPoint = function(id, lat, lon) {
+    if (mtTracks[id] === undefined) {
+        mtTracks[id] = L.polyline([], {color: "#EB8658", weight: 2}).addTo(mtMap);
+    }
+    mtTracks[id].addLatLng([lat, lon]);
+};
+window.mtClearTracks = function() {
+    for (var id in mtTracks) { mtMap.removeLayer(mtTracks[id]); }
+    mtTracks = {};
+};
+window.mtLinks = L.layerGroup().addTo(mtMap);
+window.mtSetLinks = function(links) {
+    mtLinks.clearLayers();
+    links.forEach(function(link) {
+        var a = mtNodes[link[0]], b = mtNodes[link[1]];
+        if (a === undefined || b === undefined) { return; }
+        var color = "hsl(" + Math.round(120 * link[2]) + ", 90%, 45%)";
+        L.polyline([a.getLatLng(), b.getLatLng()], {color: color, weight: 2}).addTo(mtLinks);
+    });
+};
+window.mtCritical = L.layerGroup().addTo(mtMap);
+window.mtSetCriticalNodes = function(ids) {
+    mtCritical.clearLayers();
+    ids.forEach(function(id) {
+        if (mtNodes[id] !== undefined) {
+            L.circleMarker(mtNodes[id].getLatLng(), {radius: 14, color: "#D0021B", fill: false}).addTo(mtCritical);
+        }
+    });
+};
+window.mtOverlay = null;
+window.mtSetOverlay = function(url, west, south, east, north) {
+    if (url === null) {
+        if (mtOverlay !== null) { mtMap.removeLayer(mtOverlay); mtOverlay = null; }
+        return;
+    }
+    var bounds = L.latLngBounds([south, west], [north, east]);
+    if (mtOverlay === null) {
+        mtOverlay = L.imageOverlay(url, bounds, {className: "mt-overlay"}).addTo(mtMap);
+    } else {
+        mtOverlay.setUrl(url);
+        mtOverlay.setBounds(bounds);
+    }
+};
+window.mtBounds = function() {
+    var bounds = mtMap.getBounds();
+    return [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()];
+};
+var style = document.createElement("style");
+style.textContent = ".mt-overlay { image-rendering: pixelated; }";
+document.head.appendChild(style);
+"""
+
+
+class WebMap(QWebEngineView):
+    """Node map drawn by Leaflet in a QWebEngineView.  Provides the same node/track API as nativemap.NativeMap."""
+
+    def __init__(self, parent, path, center=(32.93, -105.81), zoom=14):
+        """Class instantiation.  Generates the folium map page at the given path and loads it."""
+        super().__init__(parent)
+
+        fmap = folium.Map(location=list(center), zoom_start=zoom)
+        fmap.save(path)
+        self.mapName = fmap.get_name()
+        self.ready = False
+        self.pending = []
+        self.bounds = None
+        self.loadFinished.connect(self._onLoaded)
+        self.load(QUrl.fromLocalFile(path))
+
+    def _run(self, script):
+        """Run JavaScript in the map page, queueing it until the page has loaded."""
+        if self.ready:
+            self.page().runJavaScript(script)
+        else:
+            self.pending.append(script)
+
+    def _onLoaded(self, ok):
+        """Install the helper functions and run any queued calls."""
+        if not ok:
+            return
+        self.ready = True
+        self.page().runJavaScript(HELPERS % self.mapName)
+        for script in self.pending:
+            self.page().runJavaScript(script)
+        self.pending = []
+
+    def setNode(self, nodeId, lat, lon, label=None):
+        """Add a node marker, or move an existing one."""
+        self._run("mtSetNode(%s, %f, %f, %s);" % (json.dumps(nodeId), lat, lon, json.dumps(label or nodeId)))
+
+    def removeNode(self, nodeId):
+        """Remove a node marker and its track."""
+        self._run("mtRemoveNode(%s);" % json.dumps(nodeId))
+
+    def addTrackPoint(self, nodeId, lat, lon):
+        """Extend a node's track with a new position."""
+        self._run("mtAddTrackPoint(%s, %f, %f);" % (json.dumps(nodeId), lat, lon))
+
+    def clearTracks(self):
+        """Remove every node track."""
+        self._run("mtClearTracks();")
+
+    def setLinks(self, links):
+        """Show topology links as (nodeA, nodeB, quality) tuples, replacing the previous set."""
+        self._run("mtSetLinks(%s);" % json.dumps([[a, b, round(quality, 2)] for a, b, quality in links]))
+
+    def setCriticalNodes(self, nodeIds):
+        """Circle the given nodes (critical relays)."""
+        self._run("mtSetCriticalNodes(%s);" % json.dumps(sorted(nodeIds)))
+
+    def setOverlay(self, image, west=0.0, south=0.0, east=0.0, north=0.0):
+        """Show a QImage in Web Mercator projection stretched over an area (e.g. the coverage heatmap), or remove it if image is None.
+
+        The image is sent to the page as a PNG data URL, so the map page itself is not regenerated.
+        """
+        if image is None:
+            self._run("mtSetOverlay(null);")
+            return
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, "PNG")
+        url = "data:image/png;base64," + bytes(buffer.data().toBase64()).decode("ascii")
+        self._run("mtSetOverlay(%s, %f, %f, %f, %f);" % (json.dumps(url), west, south, east, north))
+
+    def visibleBounds(self):
+        """Return the visible area as (west, south, east, north), or None before the page has loaded.
+
+        The page is queried asynchronously, so the result is the area seen at the previous call.
+        """
+        if self.ready:
+            self.page().runJavaScript("mtBounds();", 0, self._onBounds)
+        return self.bounds
+
+    def _onBounds(self, bounds):
+        """Record the visible area reported by the page."""
+        if bounds:
+            self.bounds = tuple(bounds)
+
+    def centerMap(self, lat, lon, zoom=None):
+        """Center the map on a position, optionally changing the zoom level."""
+        if zoom is None:
+            self._run("mtMap.panTo([%f, %f]);" % (lat, lon))
+        else:
+            self._run("mtMap.setView([%f, %f], %d);" % (lat, lon, zoom))